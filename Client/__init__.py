@@ -8,6 +8,7 @@ from .logger import load_private_key, log_result
 from .ledger import Ledger
 from .executor import execute_job
 from .comms import CoordinatorClient
+from .cache import InputCache
 from .descriptor import JobDescriptor
 from .archiver import archive_and_sign
 
@@ -21,6 +22,7 @@ __all__ = [
     "Ledger",
     "execute_job",
     "CoordinatorClient",
+    "InputCache",
     "JobDescriptor",
     "archive_and_sign"
 ]
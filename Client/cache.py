@@ -0,0 +1,155 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+from prometheus_client import Counter
+
+from input_fetch import fetch_from_ipfs, fetch_from_s3
+
+
+# Must match Server.locality.DIGEST_CHARS.
+DIGEST_CHARS = 16
+FETCHABLE_SCHEMES = ('s3', 'ipfs', 'http', 'https')
+
+input_bytes_counter = Counter(
+    'nexapod_client_input_bytes_fetched_total',
+    'Total bytes of job input downloaded'
+)
+input_cache_hits_counter = Counter(
+    'nexapod_client_input_cache_hits_total',
+    'Total number of job inputs served from the local cache'
+)
+input_cache_misses_counter = Counter(
+    'nexapod_client_input_cache_misses_total',
+    'Total number of job inputs downloaded'
+)
+
+
+def cache_digest(reference: str) -> str:
+    """Return the digest reported for a cached input URI or image.
+
+    Must match Server.locality.cache_digest.
+    """
+    return hashlib.sha256(reference.encode()).hexdigest()[:DIGEST_CHARS]
+
+
+def download(uri: str, dest: str):
+    """Download an s3://, ipfs:// or http(s):// input to ``dest``."""
+    parsed = urlparse(uri)
+    if parsed.scheme == 's3':
+        fetch_from_s3(uri, dest)
+    elif parsed.scheme == 'ipfs':
+        target = tempfile.mkdtemp(dir=os.path.dirname(dest))
+        try:
+            fetch_from_ipfs(parsed.netloc, target)
+            os.replace(os.path.join(target, parsed.netloc), dest)
+        finally:
+            shutil.rmtree(target, ignore_errors=True)
+    else:
+        with requests.get(uri, stream=True) as resp:
+            resp.raise_for_status()
+            with open(dest, 'wb') as f:
+                for chunk in resp.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+
+
+class InputCache:
+    """Least-recently-used disk cache of job inputs.
+
+    Inputs are stored under ``cache_dir`` by the digest of their URI and
+    evicted oldest first beyond ``cache_max_gb``; files left by earlier
+    runs are picked up again. Docker images used by jobs are remembered
+    too, so that ``digests`` can tell the coordinator what this node
+    already holds.
+    """
+    def __init__(self, config: dict):
+        self.directory = os.path.expanduser(
+            config.get('cache_dir', '~/.nexapod/cache')
+        )
+        self.max_bytes = config.get('cache_max_gb', 20) * 1e9
+        self.report_limit = config.get('cache_report_limit', 256)
+        self._lock = threading.Lock()
+        # digest -> size in bytes, least recently used first.
+        self._inputs = OrderedDict()
+        self._images = OrderedDict()
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if len(name) == DIGEST_CHARS and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, digest, size in sorted(entries):
+            self._inputs[digest] = size
+
+    @staticmethod
+    def fetchable(uri: str | None) -> bool:
+        """Check whether the URI names an input this cache can download."""
+        return bool(uri) and urlparse(uri).scheme in FETCHABLE_SCHEMES
+
+    def fetch(self, uri: str) -> str:
+        """Return a local path holding the input, downloading it if needed."""
+        digest = cache_digest(uri)
+        path = os.path.join(self.directory, digest)
+        with self._lock:
+            if digest in self._inputs and os.path.exists(path):
+                self._inputs.move_to_end(digest)
+                os.utime(path)
+                input_cache_hits_counter.inc()
+                return path
+        fd, partial = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        os.close(fd)
+        try:
+            download(uri, partial)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        size = os.path.getsize(path)
+        input_bytes_counter.inc(size)
+        input_cache_misses_counter.inc()
+        with self._lock:
+            self._inputs[digest] = size
+            self._inputs.move_to_end(digest)
+            self._evict(keep=digest)
+        return path
+
+    def _evict(self, keep: str):
+        """Delete least recently used inputs until under ``max_bytes``."""
+        total = sum(self._inputs.values())
+        for digest in list(self._inputs):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            total -= self._inputs.pop(digest)
+            try:
+                os.remove(os.path.join(self.directory, digest))
+            except FileNotFoundError:
+                pass
+
+    def note_image(self, image: str):
+        """Record that a Docker image is available locally."""
+        with self._lock:
+            self._images[cache_digest(image)] = image
+            self._images.move_to_end(cache_digest(image))
+
+    def digests(self) -> list:
+        """Return digests of cached inputs and images, most recent first.
+
+        At most ``cache_report_limit`` are returned, split evenly between
+        inputs and images when both have more.
+        """
+        with self._lock:
+            inputs = list(reversed(self._inputs))
+            images = list(reversed(self._images))
+        half = self.report_limit // 2
+        image_count = min(len(images),
+                          max(half, self.report_limit - len(inputs)))
+        input_count = min(len(inputs), self.report_limit - image_count)
+        return inputs[:input_count] + images[:image_count]
@@ -1,15 +1,31 @@
+import json
+import threading
 import time
-from typing import Any
+from collections import deque
+from typing import Any, Iterable, Iterator
 
 import requests
 
 
 class CoordinatorClient:
-    """Client for interacting with the coordinator API."""
-    def __init__(self, config: dict):
+    """Client for interacting with the coordinator API.
+
+    With an InputCache, every lease request reports the digests of the
+    inputs and images the node holds, so the coordinator can send it jobs
+    that need no download.
+    """
+    def __init__(self, config: dict, cache=None):
         self.url = config['coordinator_url']
+        self.cache = cache
         self.node_id = config.get('node_id')
         self.poll_interval = config.get('poll_interval', 10)
+        self.long_poll_timeout = config.get('long_poll_timeout', 30)
+        self.prefetch = max(config.get('prefetch', 1), 1)
+        self.prefetch_low_water = config.get('prefetch_low_water', 0)
+        self.heartbeat_interval = config.get('heartbeat_interval', 60)
+        self._buffer = deque()
+        self._active = set()
+        self._lock = threading.Lock()
 
     def register_node(self, profile: dict):
         """Register this node with the coordinator."""
@@ -20,23 +36,137 @@ class CoordinatorClient:
             raise Exception(f"Registration failed: {resp.text}")
 
     def poll_job(self) -> Any | None:
-        """Poll coordinator for a new job."""
-        resp = requests.get(
-            f"{self.url}/job",
-            params={'node_id': self.node_id}
-        )
-        if resp.ok and resp.json():
-            return resp.json()
-        time.sleep(self.poll_interval)
+        """Return the next job, leasing a batch from the coordinator as needed.
+
+        Jobs are leased up to ``prefetch`` at a time and buffered locally;
+        the buffer is topped up whenever it drops to ``prefetch_low_water``.
+        When the buffer is empty the lease request long-polls for up to
+        ``long_poll_timeout`` seconds, so new work is picked up as soon as
+        it is queued; ``poll_interval`` only applies when long-polling is
+        disabled or the request fails.
+        """
+        refilled = True
+        if len(self._buffer) <= self.prefetch_low_water:
+            refilled = self._refill(wait=not self._buffer)
+        with self._lock:
+            if self._buffer:
+                job = self._buffer.popleft()
+                self._active.add(job['job_id'])
+                return job
+        if not refilled or self.long_poll_timeout <= 0:
+            time.sleep(self.poll_interval)
         return None
 
+    def poll_jobs(self, limit: int, wait: bool = True) -> list:
+        """Return up to ``limit`` jobs to start now.
+
+        Buffered jobs are handed out first and the rest are leased with a
+        long-poll as in poll_job, but nothing is leased ahead: every job
+        the coordinator counts against this node's capacity is one the
+        caller is about to run. Without ``wait`` the lease request returns
+        at once, even if empty.
+        """
+        with self._lock:
+            jobs = [self._buffer.popleft()
+                    for _ in range(min(limit, len(self._buffer)))]
+        if len(jobs) < limit:
+            leased = self._lease(limit - len(jobs), wait=wait and not jobs)
+            if leased:
+                jobs.extend(leased)
+            elif wait and not jobs and (
+                leased is None or self.long_poll_timeout <= 0
+            ):
+                time.sleep(self.poll_interval)
+        with self._lock:
+            self._active.update(job['job_id'] for job in jobs)
+        return jobs
+
+    def abandon(self, job_id: str):
+        """Stop renewing the lease of a job that will not be reported."""
+        with self._lock:
+            self._active.discard(job_id)
+
+    def _refill(self, wait: bool = False) -> bool:
+        """Lease enough jobs to fill the prefetch buffer."""
+        jobs = self._lease(self.prefetch - len(self._buffer), wait)
+        if jobs is None:
+            return False
+        with self._lock:
+            self._buffer.extend(jobs)
+        return True
+
+    def _lease(self, count: int, wait: bool = False) -> list | None:
+        """Lease up to ``count`` jobs; None if the request failed."""
+        params = {'node_id': self.node_id, 'max': count}
+        if self.cache is not None:
+            cached = self.cache.digests()
+            if cached:
+                params['cached'] = ','.join(cached)
+        timeout = None
+        if wait and self.long_poll_timeout > 0:
+            params['wait'] = self.long_poll_timeout
+            timeout = self.long_poll_timeout + 30
+        resp = requests.get(f"{self.url}/job", params=params, timeout=timeout)
+        return resp.json().get('jobs', []) if resp.ok else None
+
+    def heartbeat(self) -> dict:
+        """Renew leases on running and buffered jobs.
+
+        Buffered jobs the coordinator reports as lost are dropped so they
+        are not started after another node has taken them over.
+        """
+        with self._lock:
+            job_ids = list(self._active)
+            job_ids += [job['job_id'] for job in self._buffer]
+        resp = requests.post(
+            f"{self.url}/heartbeat",
+            json={'node_id': self.node_id, 'job_ids': job_ids}
+        )
+        if not resp.ok:
+            raise Exception(f"Heartbeat failed: {resp.text}")
+        lost = set(resp.json().get('lost', []))
+        if lost:
+            with self._lock:
+                self._buffer = deque(
+                    job for job in self._buffer if job['job_id'] not in lost
+                )
+        return resp.json()
+
+    def start_heartbeat(self) -> threading.Thread:
+        """Send heartbeats every ``heartbeat_interval`` in a daemon thread."""
+        def run():
+            while True:
+                time.sleep(self.heartbeat_interval)
+                try:
+                    self.heartbeat()
+                except Exception as e:
+                    print(f"Heartbeat error: {e}")
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
     def submit_result(self, result: dict) -> dict:
         """Submit execution result back to coordinator."""
+        with self._lock:
+            self._active.discard(result.get('job_id'))
         resp = requests.post(f"{self.url}/result", json=result)
         if resp.ok:
             return resp.json()
         raise Exception(f"Result submission failed: {resp.text}")
 
+    def submit_results(self, results: list) -> list:
+        """Submit many execution results in one request.
+
+        Returns the coordinator's per-result statuses, in order.
+        """
+        with self._lock:
+            for result in results:
+                self._active.discard(result.get('job_id'))
+        resp = requests.post(f"{self.url}/results/batch", json=results)
+        if resp.ok:
+            return resp.json()['results']
+        raise Exception(f"Result submission failed: {resp.text}")
+
     def submit_job(self, param: dict) -> dict:
         """Submit a new job to the coordinator."""
         resp = requests.post(f"{self.url}/jobs", json=param)
@@ -44,6 +174,18 @@ class CoordinatorClient:
             raise Exception(f"Job submission failed: {resp.text}")
         return resp.json()
 
+    def submit_jobs(self, jobs: Iterable[dict]) -> dict:
+        """Stream many jobs to the coordinator as NDJSON."""
+        body = (json.dumps(job).encode() + b'\n' for job in jobs)
+        resp = requests.post(
+            f"{self.url}/jobs/batch",
+            data=body,
+            headers={'Content-Type': 'application/x-ndjson'}
+        )
+        if not resp.ok:
+            raise Exception(f"Batch job submission failed: {resp.text}")
+        return resp.json()
+
     def get_status(self) -> dict:
         """Check the node status with coordinator."""
         resp = requests.get(
@@ -54,19 +196,101 @@ class CoordinatorClient:
             return resp.json()
         raise Exception(f"Status check failed: {resp.text}")
 
+    def _get_pages(self, path: str, params: dict) -> list:
+        """Fetch every page of a keyset-paginated listing endpoint."""
+        rows = []
+        params = dict(params)
+        while True:
+            resp = requests.get(f"{self.url}{path}", params=params)
+            if not resp.ok:
+                raise Exception(f"Failed to fetch {path}: {resp.text}")
+            rows.extend(resp.json())
+            after = resp.headers.get('X-Next-After')
+            if not after:
+                return rows
+            params['after'] = after
+
     def get_nodes(self) -> list:
         """Fetch list of all registered nodes."""
-        resp = requests.get(f"{self.url}/nodes")
-        if resp.ok:
-            return resp.json()
-        raise Exception(f"Failed to fetch nodes: {resp.text}")
+        return self._get_pages("/nodes", {})
 
-    def get_jobs_list(self) -> list:
-        """Fetch list of all jobs in the system."""
-        resp = requests.get(f"{self.url}/jobs")
+    def get_jobs_list(self, **filters) -> list:
+        """Fetch list of all jobs, optionally filtered by status/submitter."""
+        return self._get_pages("/jobs/all", filters)
+
+    def get_changes(self, since: int = 0, limit: int | None = None) -> dict:
+        """Fetch job and node state transitions after sequence ``since``."""
+        params = {'since': since}
+        if limit is not None:
+            params['limit'] = limit
+        resp = requests.get(f"{self.url}/changes", params=params)
         if resp.ok:
             return resp.json()
-        raise Exception(f"Failed to fetch jobs: {resp.text}")
+        raise Exception(f"Failed to fetch changes: {resp.text}")
+
+    def iter_jobs(self, **filters) -> Iterator[dict]:
+        """Stream jobs from the coordinator without buffering the listing."""
+        with requests.get(
+            f"{self.url}/jobs/stream", params=filters, stream=True
+        ) as resp:
+            if not resp.ok:
+                raise Exception(f"Failed to stream jobs: {resp.text}")
+            for line in resp.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+
+class ClusterView:
+    """Local copy of coordinator node and job state.
+
+    The first refresh takes a snapshot through the listing endpoints; later
+    refreshes only apply the deltas from ``/changes``, so their cost tracks
+    the number of transitions rather than the size of the tables.
+    """
+    def __init__(self, client: CoordinatorClient):
+        self.client = client
+        self.nodes = {}
+        self.jobs = {}
+        self.seq = None
+
+    def refresh(self):
+        """Bring the view up to date with the coordinator."""
+        if self.seq is None:
+            self._snapshot()
+        while True:
+            feed = self.client.get_changes(self.seq)
+            if feed['reset']:
+                self._snapshot()
+                continue
+            for change in feed['changes']:
+                self._apply(change)
+            self.seq = feed['last_seq']
+            if not feed['changes']:
+                return
+
+    def _snapshot(self):
+        """Rebuild the view from full listings."""
+        self.seq = self.client.get_changes(0, limit=0)['last_seq']
+        self.nodes = {
+            node['node_id']: node for node in self.client.get_nodes()
+        }
+        self.jobs = {
+            job['job_id']: job
+            for job in self.client.get_jobs_list(
+                fields='job_id,status,assigned_node,submitter'
+            )
+        }
+
+    def _apply(self, change: dict):
+        """Fold one change record into the view."""
+        if change['kind'] == 'node':
+            self.nodes[change['id']] = {
+                'node_id': change['id'], 'profile': change['data']
+            }
+        else:
+            job = self.jobs.setdefault(change['id'], {'job_id': change['id']})
+            job['status'] = change['status']
+            job['assigned_node'] = change['assigned_node']
 
 
 def get_node_profile() -> dict:
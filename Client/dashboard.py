@@ -8,7 +8,7 @@ import numpy as np
 import plotly.graph_objects as go
 import streamlit as st
 
-from comms import CoordinatorClient
+from comms import ClusterView, CoordinatorClient
 
 st.set_page_config(
     page_title="NEXAPod Dashboard",
@@ -281,13 +281,20 @@ class NEXAPodDashboard:
             st.session_state.coord = CoordinatorClient({
                 "coordinator_url": cfg["coordinator_url"]
             })
-        if 'nodes' not in st.session_state:
-            st.session_state.nodes = st.session_state.coord.get_nodes()
-        if 'jobs' not in st.session_state:
-            st.session_state.jobs = st.session_state.coord.get_jobs_list()
+            st.session_state.view = ClusterView(st.session_state.coord)
+        if 'nodes' not in st.session_state or 'jobs' not in st.session_state:
+            refresh_view()
         if 'last_update' not in st.session_state:
             st.session_state.last_update = datetime.now()
 
+def refresh_view():
+    """Apply coordinator changes to the cached nodes and jobs."""
+    view = st.session_state.view
+    view.refresh()
+    st.session_state.nodes = list(view.nodes.values())
+    st.session_state.jobs = list(view.jobs.values())
+
+
 def main():
     """Main NEXAPod Dashboard application."""
     dashboard = NEXAPodDashboard()
@@ -305,7 +312,7 @@ def main():
                               value=10)
 
         if st.button("Regenerate Network"):
-            st.session_state.nodes = st.session_state.coord.get_nodes()
+            refresh_view()
             st.rerun()
 
         st.subheader("Filters")
@@ -327,8 +334,7 @@ def main():
         st.write(f"**Last Update:** {last_update_time}")
 
         if st.button("Refresh Dashboard"):
-            st.session_state.nodes = st.session_state.coord.get_nodes()
-            st.session_state.jobs = st.session_state.coord.get_jobs_list()
+            refresh_view()
             st.session_state.last_update = datetime.now()
             st.rerun()
 
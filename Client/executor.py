@@ -1,24 +1,56 @@
 import tempfile
+import time
 import docker
+from prometheus_client import Histogram
 
 
-def execute_job(job: dict) -> dict:
+cold_start_histogram = Histogram(
+    'nexapod_client_cold_start_seconds',
+    'Time from taking a job to starting its container',
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800)
+)
+
+
+def local_images() -> list:
+    """Return the tags of the Docker images present on this node."""
+    client = docker.from_env()
+    return [tag for image in client.images.list() for tag in image.tags]
+
+
+def execute_job(job: dict, cache=None) -> dict:
     """
     Pull Docker image, prepare inputs, run container, and return
     execution result.
+
+    The image is only pulled when it is not present locally. With an
+    InputCache the job's ``input_uri`` is fetched through it and mounted
+    read-only at /inputs/data, so repeated inputs are not downloaded
+    again.
     """
+    started = time.time()
     client = docker.from_env()
     image = job['docker_image']
     job_id = job['job_id']
-    client.images.pull(image)
+    try:
+        client.images.get(image)
+    except docker.errors.ImageNotFound:
+        client.images.pull(image)
     input_dir = tempfile.mkdtemp(prefix=f"nexapod_{job_id}_")
     for input_file in job.get('input_files', []):
         path = f"{input_dir}/{input_file['name']}"
         with open(path, 'wb') as f:
             f.write(input_file['content'])
+    volumes = {input_dir: {'bind': '/inputs', 'mode': 'rw'}}
+    if cache is not None:
+        cache.note_image(image)
+        if cache.fetchable(job.get('input_uri')):
+            volumes[cache.fetch(job['input_uri'])] = {
+                'bind': '/inputs/data', 'mode': 'ro'
+            }
+    cold_start_histogram.observe(time.time() - started)
     output = client.containers.run(
         image,
-        volumes={input_dir: {'bind': '/inputs', 'mode': 'rw'}},
+        volumes=volumes,
         remove=True
     )
     return {
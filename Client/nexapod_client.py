@@ -1,12 +1,15 @@
 import argparse
 import json
 import os
+import threading
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 from prometheus_client import Counter, start_http_server
+from cache import InputCache
 from comms import CoordinatorClient
-from executor import execute_job
+from executor import execute_job, local_images
 from logger import log_result
 from profiles import get_node_profile
 
@@ -34,6 +37,69 @@ def load_config() -> dict:
         return yaml.safe_load(f)
 
 
+def process_job(client: CoordinatorClient, job: dict, config: dict, cache):
+    """Execute one leased job, then log and submit its result."""
+    try:
+        result = execute_job(job, cache)
+    except Exception as e:
+        client.abandon(job['job_id'])
+        jobs_executed_failure_counter.inc()
+        print(f"Job {job['job_id']} failed: {e}")
+        return
+    # Metrics for execution outcome
+    if result.get('status') == 'completed':
+        jobs_executed_success_counter.inc()
+    else:
+        jobs_executed_failure_counter.inc()
+    log_result(result, config)
+    client.submit_result(result)
+
+
+def run_jobs(client: CoordinatorClient, config: dict, cache=None):
+    """Run leased jobs concurrently, up to ``max_concurrent_jobs`` at once.
+
+    Jobs are only leased for idle workers, and the coordinator only hands
+    out jobs that fit in the node's free cores, RAM and GPU memory, so
+    every lease the node holds is a job that is running. While some jobs
+    run, a poll that finds nothing that fits is retried when one of them
+    finishes (or after ``poll_interval``) instead of long-polling.
+    """
+    workers = max(config.get('max_concurrent_jobs', 4), 1)
+    idle = threading.Condition()
+    running = 0
+    finished = 0
+
+    def work(job):
+        nonlocal running, finished
+        try:
+            process_job(client, job, config, cache)
+        except Exception as e:
+            print(f"Result submission error: {e}")
+        finally:
+            with idle:
+                running -= 1
+                finished += 1
+                idle.notify_all()
+
+    with ThreadPoolExecutor(workers, thread_name_prefix='nexapod-job') as pool:
+        while True:
+            with idle:
+                idle.wait_for(lambda: running < workers)
+                free = workers - running
+                busy = running > 0
+                seen = finished
+            jobs = client.poll_jobs(free, wait=not busy)
+            jobs_polled_counter.inc(len(jobs))
+            with idle:
+                running += len(jobs)
+            for job in jobs:
+                pool.submit(work, job)
+            if busy and not jobs:
+                with idle:
+                    idle.wait_for(lambda: finished != seen,
+                                  client.poll_interval)
+
+
 def main():
     """Entry point for NEXAPod client node."""
     global key
@@ -82,18 +148,12 @@ def main():
         client.register_node(payload)
         print('Node registered with coordinator.')
     elif args.command == 'run':
-        while True:
-            job = client.poll_job()
-            if job:
-                jobs_polled_counter.inc()
-                result = execute_job(job)
-                # Metrics for execution outcome
-                if result.get('status') == 'completed':
-                    jobs_executed_success_counter.inc()
-                else:
-                    jobs_executed_failure_counter.inc()
-                log_result(result, config)
-                client.submit_result(result)
+        cache = InputCache(config)
+        for image in local_images():
+            cache.note_image(image)
+        client.cache = cache
+        client.start_heartbeat()
+        run_jobs(client, config, cache)
 
 
 if __name__ == '__main__':
@@ -1,13 +1,17 @@
 """
 Infrastructure package for NEXAPod.
 """
-from .api import app, scheduler, db
 from .database import Database
 from .Descriptor import RateLimitDescriptor
 from .node import Node
 from .scheduler import Scheduler
 from .validator import generate_signature, validate_log
 
+# Loading .api opens nexapod.db in the working directory, so its objects
+# are only imported when first used rather than with the package. Its
+# scheduler instance is api.scheduler: the name here is the submodule.
+_API_EXPORTS = ("app", "db")
+
 __all__ = [
     "app",
     "db",
@@ -15,7 +19,14 @@ __all__ = [
     "generate_signature",
     "Node",
     "RateLimitDescriptor",
-    "scheduler",
     "Scheduler",
     "validate_log",
 ]
+
+
+def __getattr__(name):
+    """Import the Flask API objects on first access."""
+    if name in _API_EXPORTS:
+        from . import api
+        return getattr(api, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
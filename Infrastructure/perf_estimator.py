@@ -1,15 +1,25 @@
 """
 Performance estimation utilities.
 """
-from NexaPod_CLI.descriptor import JobDescriptor
+from typing import Any
 
 
-def estimate_flops(desc: JobDescriptor) -> float:
-    """Return the compute estimate from job descriptor."""
+def estimate_flops(desc: Any) -> float:
+    """Return the compute estimate from a job descriptor.
+
+    Accepts descriptor objects exposing ``compute_estimate`` as well as the
+    JSON job dicts handled by the coordinator, which carry
+    ``estimated_flops`` at the top level or under ``execution``.
+    """
+    if isinstance(desc, dict):
+        flops = desc.get("estimated_flops")
+        if flops is None:
+            flops = desc.get("execution", {}).get("estimated_flops", 0.0)
+        return float(flops or 0.0)
     return desc.compute_estimate
 
 
-def estimate_time(desc: JobDescriptor, hardware_flops: float) -> float:
+def estimate_time(desc: Any, hardware_flops: float) -> float:
     """Estimate execution time in seconds given hardware performance."""
     flops = estimate_flops(desc)
     return flops / hardware_flops
@@ -86,9 +86,9 @@ def save_results_to_db(results: list, db_path: str):
 
 
 def submit_results(results: list, client: CoordinatorClient):
-    """Submit prediction results back to the coordinator."""
-    for r in results:
-        client.submit_result(r)
+    """Submit prediction results back to the coordinator in one batch."""
+    if results:
+        client.submit_results(results)
 
 
 def main():
@@ -0,0 +1,33 @@
+"""
+Async access to the blocking coordinator components.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncFacade:
+    """Exposes a blocking object's methods as coroutines.
+
+    Calls are dispatched to a shared thread pool, so FastAPI handlers can
+    await database and scheduler work without stalling the event loop.
+    Non-callable attributes are returned unchanged.
+    """
+
+    def __init__(self, target, executor: ThreadPoolExecutor):
+        self._target = target
+        self._executor = executor
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(attr, *args, **kwargs)
+            )
+        call.__name__ = name
+        call.__doc__ = attr.__doc__
+        return call
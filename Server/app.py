@@ -1,20 +1,42 @@
 """
 REST API for NEXAPod server coordinator.
 """
+import asyncio
+import glob
 import os
 import json
+import logging
 import yaml
 import uvicorn
-from fastapi import FastAPI, Request, Response, HTTPException
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Query, Request, Response, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
-from prometheus_client import Counter, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+    multiprocess, CONTENT_TYPE_LATEST,
+)
+from Server.aio import AsyncFacade
 from Server.scheduler import Scheduler
-from Server.db import DB
+from Server.sweeper import LeaseSweeper
+from Server.speculator import Speculator
+from Server.compactor import Compactor
+from Server.fair_share import job_cost, submitter_of
+from Server.locality import cache_digest, parse_cached
+from Server.index_sync import IndexSync
+from Server.storage import create_storage
+from Server.notifier import JobNotifier
 from Server.reputation import Reputation
 from Infrastructure.output_validator import load_checker
+from Protocol.protocol import JobDescriptor
 
 
-CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.yaml")
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.environ.get(
+    "NEXAPOD_CONFIG", os.path.join(os.path.dirname(__file__), "config.yaml")
+)
 
 
 def load_config() -> dict:
@@ -23,14 +45,85 @@ def load_config() -> dict:
         return yaml.safe_load(f)
 
 
+def worker_count(config: dict) -> int:
+    """Return the number of coordinator processes to run."""
+    return int(os.environ.get("WORKERS", config.get("workers", 1)))
+
+
+async def iter_batch_items(request: Request):
+    """Yield job dicts from a JSON array body or an NDJSON stream.
+
+    NDJSON bodies are consumed incrementally so arbitrarily large
+    submissions never have to be held in memory at once.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type and "jsonlines" not in content_type:
+        items = await request.json()
+        if not isinstance(items, list):
+            raise HTTPException(
+                status_code=400, detail="Expected a JSON array of jobs"
+            )
+        for item in items:
+            yield item
+        return
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application."""
     config = load_config()
     validator = load_checker(config["validator_plugin"])
     quorum = config.get("quorum", 1)
-    db = DB(config)
-    scheduler = Scheduler(db, config)
-    reputation = Reputation(db, config)
+    batch_chunk_size = config.get("batch_chunk_size", 1000)
+    max_lease = config.get("max_lease", 64)
+    long_poll_max_wait = config.get("long_poll_max_wait", 30)
+    long_poll_recheck = config.get("long_poll_recheck", 5)
+    list_page_size = config.get("list_page_size", 1000)
+    list_max_page_size = config.get("list_max_page_size", 10000)
+    changes_poll_interval = config.get("changes_poll_interval", 1)
+    max_cached_digests = config.get("locality", {}).get("max_reported", 256)
+    database = create_storage(config)
+    # Handlers await the blocking DB and scheduler through a thread pool so
+    # a slow query never stalls the event loop; reads on the pool threads
+    # use their own connections and run alongside the writer.
+    executor = ThreadPoolExecutor(
+        max_workers=config.get("db_pool_size", 16),
+        thread_name_prefix="nexapod-db"
+    )
+    db = AsyncFacade(database, executor)
+    notifier = JobNotifier()
+    job_scheduler = Scheduler(database, config, notifier.notify)
+    scheduler = AsyncFacade(job_scheduler, executor)
+    reputation = Reputation(database, config)
+    sweeper = LeaseSweeper(
+        job_scheduler, config.get("lease_sweep_interval", 15)
+    )
+    sweeper.start()
+    compaction = config.get("compaction", {})
+    compactor = Compactor(
+        database,
+        interval=compaction.get("interval", 300),
+        finished_age=compaction.get("finished_age", 3600),
+        batch_size=compaction.get("batch_size", 500),
+        changes_retention=compaction.get("changes_retention", 100000),
+    )
+    compactor.start()
+    speculation = config.get("speculation", {})
+    if speculation.get("enabled", True):
+        Speculator(job_scheduler, speculation.get("interval", 10)).start()
+    if worker_count(config) > 1 and job_scheduler.use_index:
+        # Other workers queue jobs this process's index never sees.
+        IndexSync(
+            job_scheduler, config.get("index_sync_interval", 1)
+        ).start()
     app = FastAPI()
 
     node_register_counter = Counter(
@@ -51,6 +144,28 @@ def create_app() -> FastAPI:
         "nexapod_job_submitted_total",
         "Total number of jobs submitted"
     )
+    job_completion_histogram = Histogram(
+        "nexapod_job_completion_seconds",
+        "Time from job submission to finalization",
+        buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600,
+                 86400)
+    )
+    submitter_dispatched_counter = Counter(
+        "nexapod_submitter_dispatched_seconds_total",
+        "Reference-node seconds of work leased per submitter; a "
+        "submitter's rate over the sum is its share of throughput",
+        ["submitter"]
+    )
+    job_input_cached_counter = Counter(
+        "nexapod_job_input_cached_total",
+        "Jobs leased to a node that reported their input as cached"
+    )
+    submitter_queue_gauge = Gauge(
+        "nexapod_submitter_queue_depth",
+        "Pending jobs queued per submitter",
+        ["submitter"],
+        multiprocess_mode="mostrecent"
+    )
 
     @app.post("/register")
     async def register_node(request: Request):
@@ -70,17 +185,78 @@ def create_app() -> FastAPI:
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid signature")
         payload["public_key"] = public_key_hex
-        node_id = db.register_node(payload)
+        node_id = await db.register_node(payload)
         node_register_counter.inc()
         return {"node_id": node_id}
 
+    async def lease_jobs(node_id, limit, wait, cached):
+        """Lease up to ``limit`` jobs, parking up to ``wait`` seconds for work.
+
+        While parked the request only wakes when the scheduler reports new
+        or reclaimed jobs, or every ``long_poll_recheck`` seconds to pick up
+        work queued by other coordinator processes.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while True:
+            generation = notifier.generation()
+            jobs = await scheduler.assign_jobs(node_id, limit, cached)
+            remaining = deadline - loop.time()
+            if jobs or remaining <= 0:
+                return jobs
+            await notifier.wait(
+                generation, min(remaining, long_poll_recheck)
+            )
+
     @app.get("/job")
-    async def get_job(node_id: str):
-        """Assign and return a pending job for the given node."""
-        job = scheduler.assign_job(node_id)
-        if job:
-            job_assigned_counter.inc()
-        return job or {}
+    async def get_job(
+        node_id: str,
+        limit: int | None = Query(None, alias="max"),
+        wait: float = 0,
+        cached: str | None = None,
+    ):
+        """Assign and return a pending job for the given node.
+
+        With ``max`` set, up to that many jobs (capped at ``max_lease``) are
+        leased atomically and returned as ``{"jobs": [...]}``. With ``wait``
+        set, an empty queue holds the request open for up to that many
+        seconds (capped at ``long_poll_max_wait``) until a job arrives.
+        ``cached`` lists, comma-separated, the digests of the inputs and
+        images the node holds (see Server.locality); jobs using them are
+        preferred.
+        """
+        count = 1 if limit is None else min(max(limit, 1), max_lease)
+        wait = min(max(wait, 0), long_poll_max_wait)
+        cached = parse_cached(cached, max_cached_digests)
+        jobs = await lease_jobs(node_id, count, wait, cached)
+        job_assigned_counter.inc(len(jobs))
+        for job in jobs:
+            uri = job.get("input_uri")
+            if uri and cache_digest(uri) in cached:
+                job_input_cached_counter.inc()
+            submitter_dispatched_counter.labels(submitter_of(job)).inc(
+                job_cost(job, config)
+            )
+        if limit is not None:
+            return {"jobs": jobs}
+        return jobs[0] if jobs else {}
+
+    @app.post("/heartbeat")
+    async def heartbeat(request: Request):
+        """Renew the leases a node holds on its running and buffered jobs.
+
+        The body is ``{"node_id": ..., "job_ids": [...]}``; omitting
+        ``job_ids`` renews every lease held by the node. Jobs listed under
+        ``lost`` were reclaimed or finalized and should be abandoned.
+        """
+        payload = await request.json()
+        node_id = payload.get("node_id")
+        if not node_id:
+            raise HTTPException(status_code=400, detail="Missing node_id")
+        job_ids = payload.get("job_ids")
+        renewed = await scheduler.renew_leases(node_id, job_ids)
+        lost = sorted(set(job_ids or []) - set(renewed))
+        return {"renewed": renewed, "lost": lost}
 
     @app.post("/result")
     async def submit_result(request: Request):
@@ -98,38 +274,305 @@ def create_app() -> FastAPI:
             raise HTTPException(
                 status_code=400, detail="Result validation failed"
             )
-        db.add_vote(result)
-        votes = db.count_votes(result["job_id"], result["sha256"])
-        if votes >= quorum:
-            final = db.get_vote_result(result["job_id"], result["sha256"])
-            db.finalize_job(final)
-            reputation.update_credits(final)
+        (outcome,) = await scheduler.record_votes([result], quorum)
+        if outcome["status"] == "rejected":
+            job_result_failure_counter.inc()
+            raise HTTPException(status_code=400, detail=outcome["error"])
+        if outcome["status"] == "finalized":
+            reputation.update_credits(result)
             job_result_success_counter.inc()
-            return {"status": "finalized", "votes": votes}
-        return {"status": "vote recorded", "votes": votes}
+            job_completion_histogram.observe(outcome["completion_seconds"])
+        return {"status": outcome["status"], "votes": outcome["votes"]}
+
+    @app.post("/results/batch")
+    async def submit_results(request: Request):
+        """Validate many results in parallel and record them together.
+
+        Valid results are voted on and finalized in a single transaction.
+        Returns one status per submitted result, in order; invalid results,
+        including array items that are not objects, are reported as
+        ``rejected`` without affecting the others.
+        """
+        results = await request.json()
+        if not isinstance(results, list):
+            raise HTTPException(
+                status_code=400, detail="Expected a JSON array of results"
+            )
+        loop = asyncio.get_running_loop()
+        objects = [i for i, result in enumerate(results)
+                   if isinstance(result, dict)]
+        checks = [None] * len(results)
+        for i, valid in zip(objects, await asyncio.gather(
+            *(loop.run_in_executor(executor, validator, results[i])
+              for i in objects),
+            return_exceptions=True
+        )):
+            checks[i] = valid
+        statuses = [None] * len(results)
+        accepted = []
+        for i, (result, valid) in enumerate(zip(results, checks)):
+            if not isinstance(result, dict):
+                error = "Expected a JSON object"
+            elif isinstance(valid, Exception):
+                error = f"Validation error: {valid}"
+            elif not valid:
+                error = "Result validation failed"
+            else:
+                accepted.append(i)
+                continue
+            job_result_failure_counter.inc()
+            statuses[i] = {
+                "job_id": (result.get("job_id")
+                           if isinstance(result, dict) else None),
+                "status": "rejected",
+                "error": error,
+            }
+        outcomes = await scheduler.record_votes(
+            [results[i] for i in accepted], quorum
+        )
+        for i, outcome in zip(accepted, outcomes):
+            if outcome["status"] == "rejected":
+                job_result_failure_counter.inc()
+            elif outcome["status"] == "finalized":
+                reputation.update_credits(results[i])
+                job_result_success_counter.inc()
+                job_completion_histogram.observe(
+                    outcome["completion_seconds"]
+                )
+            statuses[i] = outcome
+        return {"results": statuses}
 
     @app.post("/jobs")
     async def submit_job(request: Request):
         """Submit a new job to the scheduling queue."""
         job = await request.json()
-        db.add_job(job)
+        await scheduler.submit_job(job)
         job_submitted_counter.inc()
         return {"status": "job added"}
 
+    @app.post("/jobs/batch")
+    async def submit_jobs(request: Request):
+        """Submit many jobs at once, acknowledging each committed chunk.
+
+        Accepts a JSON array or an ``application/x-ndjson`` stream. Every
+        item is validated against ``JobDescriptor``; valid items are written
+        in transactions of ``batch_chunk_size`` rows.
+        """
+        chunks = []
+        pending = []
+        rejected = []
+        index = 0
+
+        async def flush():
+            inserted = (
+                await scheduler.submit_jobs(list(pending)) if pending else 0
+            )
+            job_submitted_counter.inc(inserted)
+            chunks.append({
+                "chunk": len(chunks),
+                "received": len(pending) + len(rejected),
+                "inserted": inserted,
+                "duplicates": len(pending) - inserted,
+                "rejected": list(rejected),
+            })
+            pending.clear()
+            rejected.clear()
+
+        try:
+            async for item in iter_batch_items(request):
+                try:
+                    JobDescriptor.model_validate(item)
+                    pending.append(item)
+                except ValidationError as e:
+                    rejected.append({
+                        "index": index,
+                        "error": e.errors(
+                            include_url=False, include_input=False
+                        ),
+                    })
+                index += 1
+                if len(pending) + len(rejected) >= batch_chunk_size:
+                    await flush()
+        except json.JSONDecodeError as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Malformed job at index {index}: {e}"
+            )
+        if pending or rejected:
+            await flush()
+        return {
+            "received": index,
+            "inserted": sum(chunk["inserted"] for chunk in chunks),
+            "chunks": chunks,
+        }
+
+    def page_limit(limit):
+        """Clamp a requested page size to the configured bounds."""
+        if limit is None:
+            return list_page_size
+        return min(max(limit, 1), list_max_page_size)
+
+    async def fetch_page(list_page, after, limit, **filters):
+        """Fetch one listing page, mapping bad field names to a 400."""
+        try:
+            return await list_page(after=after, limit=limit, **filters)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def paginate(response, list_page, key, after, limit, **filters):
+        """Return one page, advertising the next cursor in X-Next-After."""
+        limit = page_limit(limit)
+        rows = await fetch_page(list_page, after, limit, **filters)
+        if len(rows) == limit:
+            response.headers["X-Next-After"] = str(rows[-1][key])
+        return rows
+
+    async def stream(list_page, key, after, **filters):
+        """Stream every matching row as NDJSON, one page in memory at a time."""
+        first = await fetch_page(list_page, after, list_page_size, **filters)
+
+        async def lines():
+            page = first
+            while True:
+                for row in page:
+                    yield json.dumps(row) + "\n"
+                if len(page) < list_page_size:
+                    return
+                page = await fetch_page(
+                    list_page, page[-1][key], list_page_size, **filters
+                )
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    def split_fields(fields):
+        """Parse a comma-separated ``fields`` parameter."""
+        if not fields:
+            return None
+        return [f.strip() for f in fields.split(",") if f.strip()] or None
+
     @app.get("/nodes")
-    async def get_all_nodes():
-        """Return a list of all registered nodes for the dashboard."""
-        return db.get_all_nodes()
+    async def get_all_nodes(
+        response: Response,
+        after: str | None = None,
+        limit: int | None = None,
+        fields: str | None = None,
+    ):
+        """Return a page of registered nodes for the dashboard.
+
+        Pages are keyed by node_id: pass the ``X-Next-After`` header of one
+        response as ``after`` to get the next page.
+        """
+        return await paginate(
+            response, db.list_nodes, "node_id", after, limit,
+            fields=split_fields(fields)
+        )
+
+    @app.get("/nodes/stream")
+    async def stream_nodes(fields: str | None = None):
+        """Stream all registered nodes as NDJSON."""
+        return await stream(
+            db.list_nodes, "node_id", None, fields=split_fields(fields)
+        )
 
     @app.get("/jobs/all")
-    async def get_all_jobs():
-        """Return a list of all jobs for the dashboard."""
-        return db.get_all_jobs()
+    async def get_all_jobs(
+        response: Response,
+        after: str | None = None,
+        limit: int | None = None,
+        status: str | None = None,
+        submitter: str | None = None,
+        fields: str | None = None,
+    ):
+        """Return a page of jobs for the dashboard.
+
+        Supports ``status`` and ``submitter`` filters and a ``fields``
+        projection (e.g. ``fields=job_id,status`` skips the job payload).
+        Pages are keyed by job_id as for /nodes.
+        """
+        return await paginate(
+            response, db.list_jobs, "job_id", after, limit,
+            status=status, submitter=submitter, fields=split_fields(fields)
+        )
+
+    @app.get("/jobs/stream")
+    async def stream_jobs(
+        after: str | None = None,
+        status: str | None = None,
+        submitter: str | None = None,
+        fields: str | None = None,
+    ):
+        """Stream matching jobs as NDJSON in constant memory."""
+        return await stream(
+            db.list_jobs, "job_id", after,
+            status=status, submitter=submitter, fields=split_fields(fields)
+        )
+
+    @app.get("/jobs/{job_id}")
+    async def get_job_details(job_id: str):
+        """Return one job and its final result, archived or not."""
+        job = await db.get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job")
+        return job
+
+    @app.get("/changes")
+    async def get_changes(since: int = 0, limit: int | None = None):
+        """Return job and node state transitions after sequence ``since``.
+
+        Consumers keep a local view current by applying the returned
+        deltas and passing ``last_seq`` back as ``since``. ``limit=0``
+        just reports the current ``last_seq``, which is where to start
+        after taking a snapshot from /jobs/all and /nodes.
+        """
+        limit = list_page_size if limit is None else min(
+            max(limit, 0), list_max_page_size
+        )
+        return await db.get_changes(since, limit)
+
+    @app.get("/changes/stream")
+    async def stream_changes(request: Request, since: int | None = None):
+        """Push state transitions as Server-Sent Events.
+
+        Each event's id is its sequence number, so a reconnecting client
+        resumes via the standard ``Last-Event-ID`` header.
+        """
+        if since is None:
+            try:
+                since = int(request.headers.get("last-event-id", 0))
+            except ValueError:
+                raise HTTPException(
+                    status_code=400, detail="Invalid Last-Event-ID header"
+                )
+
+        async def events():
+            cursor = since
+            while not await request.is_disconnected():
+                feed = await db.get_changes(cursor, list_page_size)
+                if feed["reset"]:
+                    yield "event: reset\ndata: {}\n\n"
+                for change in feed["changes"]:
+                    yield f"id: {change['seq']}\ndata: {json.dumps(change)}\n\n"
+                cursor = feed["last_seq"]
+                if len(feed["changes"]) < list_page_size:
+                    await asyncio.sleep(changes_poll_interval)
+        return StreamingResponse(events(), media_type="text/event-stream")
 
     @app.get("/metrics")
     async def metrics():
-        """Expose Prometheus metrics endpoint."""
-        data = generate_latest()
+        """Expose Prometheus metrics endpoint.
+
+        In multi-worker mode every process writes its samples to
+        PROMETHEUS_MULTIPROC_DIR and the endpoint merges all of them, so
+        any worker answers with cluster-wide totals. Queue depths are
+        read from the answering worker's index, which sees every job.
+        """
+        for submitter, depth in (await scheduler.queue_depths()).items():
+            submitter_queue_gauge.labels(submitter).set(depth)
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            data = generate_latest(registry)
+        else:
+            data = generate_latest()
         return Response(content=data, media_type=CONTENT_TYPE_LATEST)
 
     @app.get("/health")
@@ -140,15 +583,51 @@ def create_app() -> FastAPI:
     return app
 
 
+def prepare_multiprocess_metrics(config: dict):
+    """Point prometheus_client at a clean shared directory for workers.
+
+    Must run before the worker processes start; they pick the directory
+    up from the environment when they import prometheus_client.
+    """
+    path = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR",
+        config.get("prometheus_multiproc_dir", "prometheus_multiproc")
+    )
+    os.makedirs(path, exist_ok=True)
+    # Samples left by a previous run would be added to this run's totals.
+    for stale in glob.glob(os.path.join(path, "*.db")):
+        os.remove(stale)
+
+
 def main():
-    """Run the Uvicorn server."""
-    app = create_app()
+    """Run the Uvicorn server.
+
+    With ``workers`` (or the WORKERS environment variable) above 1, that
+    many processes share the SQLite job store: claims are conditional
+    updates, so each job still goes to exactly one node. Extra workers
+    only add throughput when there are cores for them to run on.
+    """
     config = load_config()
     port = int(os.environ.get("PORT", config.get("port", 8000)))
+    workers = worker_count(config)
+    if workers == 1:
+        uvicorn.run(create_app(), host="0.0.0.0", port=port)
+        return
+    cores = os.cpu_count() or 1
+    if workers > cores:
+        logger.warning(
+            "Running %d workers on %d cores; workers beyond the core count "
+            "compete for CPU and lower throughput", workers, cores
+        )
+    if config.get("storage_backend", "sqlite") != "sqlite":
+        raise ValueError("Multiple workers require storage_backend: sqlite")
+    prepare_multiprocess_metrics(config)
     uvicorn.run(
-        app,
+        "Server.app:create_app",
+        factory=True,
         host="0.0.0.0",
-        port=port
+        port=port,
+        workers=workers
     )
 
 
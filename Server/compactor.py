@@ -0,0 +1,77 @@
+"""
+Background compaction of finished jobs into the archive tables.
+"""
+import logging
+import threading
+import time
+from prometheus_client import Counter
+
+
+logger = logging.getLogger(__name__)
+
+jobs_archived_counter = Counter(
+    "nexapod_jobs_archived_total",
+    "Total number of finished jobs moved to the archive tables"
+)
+changes_trimmed_counter = Counter(
+    "nexapod_changes_trimmed_total",
+    "Total number of change feed entries deleted by compaction"
+)
+
+
+class Compactor:
+    """Periodically moves old finished jobs out of the hot tables.
+
+    Jobs are archived ``finished_age`` seconds after completion, which
+    leaves time for late votes and dashboard refreshes against the hot
+    tables. Work is done in transactions of ``batch_size`` jobs so the
+    writer is never held for long, and the change feed is trimmed to its
+    newest ``changes_retention`` entries.
+    """
+
+    def __init__(self, db, interval=300, finished_age=3600, batch_size=500,
+                 changes_retention=100000):
+        self.db = db
+        self.interval = interval
+        self.finished_age = finished_age
+        self.batch_size = batch_size
+        self.changes_retention = changes_retention
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="nexapod-compactor", daemon=True
+        )
+
+    def start(self):
+        """Start compacting in a daemon thread."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop the compactor and wait for the current pass to finish."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def compact(self):
+        """Run one compaction pass and return the number of jobs archived."""
+        before = time.time() - self.finished_age
+        archived = 0
+        while not self._stop.is_set():
+            moved = self.db.compact_finished(before, self.batch_size)
+            archived += moved
+            if moved < self.batch_size:
+                break
+        trimmed = self.db.trim_changes(self.changes_retention)
+        if archived:
+            jobs_archived_counter.inc(archived)
+            logger.info("Archived %d finished jobs", archived)
+        if trimmed:
+            changes_trimmed_counter.inc(trimmed)
+        return archived
+
+    def _run(self):
+        """Compact every ``interval`` seconds until stopped."""
+        while not self._stop.wait(self.interval):
+            try:
+                self.compact()
+            except Exception:
+                logger.exception("Compaction failed")
@@ -1,9 +1,74 @@
 """
 Database layer for NEXAPod server coordinator.
 """
+import contextlib
 import sqlite3
 import os
 import json
+import threading
+import time
+from Server.matcher import (
+    PACKED_RESOURCES, STRUCTURED_REQUIREMENTS, consume, fits, free_capacity,
+    meets_requirements, node_capabilities, packed_demand, requirement_columns,
+)
+from Server.placement import node_owner, updated_estimate
+from Server.writer import GroupCommitWriter
+from Infrastructure.perf_estimator import estimate_flops
+
+
+# Typed copies of the matching-relevant requirements and capabilities.
+REQUIREMENT_COLUMNS = tuple(f"req_{key}" for key in STRUCTURED_REQUIREMENTS)
+CAPABILITY_COLUMNS = tuple(f"cap_{key}" for key in STRUCTURED_REQUIREMENTS)
+DEMAND_COLUMNS = ", ".join(f"req_{key}" for key in PACKED_RESOURCES)
+# Columns written when a job is submitted, in the order of _job_row.
+JOB_INSERT_COLUMNS = (
+    "job_id", "job", "assigned_node", "status",
+    "submitted_at", "dispatch_rank", "submitter", "est_flops",
+    *REQUIREMENT_COLUMNS, "req_extra", "replicas",
+)
+# Columns callers may project when listing jobs and nodes.
+JOB_FIELDS = ("job_id", "job", "assigned_node", "status", "submitter")
+NODE_FIELDS = ("node_id", "profile")
+# Columns copied from jobs into jobs_archive when a job is compacted.
+ARCHIVE_COLUMNS = (
+    "job_id", "job", "assigned_node", "status",
+    "submitter", "submitted_at", "finished_at",
+)
+
+
+def _requirement_values(job):
+    """Return the REQUIREMENT_COLUMNS values and req_extra for a job."""
+    values, extra = requirement_columns(job.get("requirements"))
+    return (*values.values(), int(extra))
+
+
+def _job_row(job, submitted_at, rank, replicas):
+    """Return the _insert_jobs_sql parameters for a newly submitted job."""
+    return (
+        job["job_id"], json.dumps(job), None, "pending",
+        submitted_at, rank, job.get("submitter"), estimate_flops(job),
+        *_requirement_values(job), replicas,
+        job["job_id"],
+    )
+
+
+def _capability_values(profile):
+    """Return the CAPABILITY_COLUMNS values for a node profile."""
+    capabilities = node_capabilities(profile)
+    return tuple(capabilities.get(key) for key in STRUCTURED_REQUIREMENTS)
+
+
+def _insert_jobs_sql(verb):
+    """Build the INSERT statement used by add_job and add_jobs.
+
+    The job_id is bound a second time at the end so that a job already
+    moved to the archive cannot be submitted again under the same id.
+    """
+    return (
+        f"{verb} INTO jobs ({', '.join(JOB_INSERT_COLUMNS)}) "
+        f"SELECT {', '.join('?' * len(JOB_INSERT_COLUMNS))} "
+        "WHERE NOT EXISTS (SELECT 1 FROM jobs_archive WHERE job_id = ?)"
+    )
 
 
 class DB:
@@ -11,8 +76,88 @@ class DB:
     def __init__(self, config):
         """Initialize database connection and ensure tables exist."""
         self.db_path = config.get("db_path", "nexapod.db")
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.busy_timeout = config.get("db_busy_timeout", 30)
+        self.lease_seconds = config.get("lease_seconds", 300)
+        self.bin_packing = config.get("bin_packing", True)
+        self.perf_alpha = config.get("perf_ewma_alpha", 0.2)
+        # Every job runs on this many distinct nodes at once, one vote each.
+        self.replicas = config.get("quorum", 1)
+        # Runtime samples kept per job type for straggler detection.
+        self.runtime_window = config.get("speculation", {}).get(
+            "runtime_window", 1000
+        )
+        self.conn = sqlite3.connect(
+            self.db_path, timeout=self.busy_timeout, check_same_thread=False
+        )
+        # WAL lets readers run alongside the writer and lets several
+        # coordinator processes share the file; busy_timeout makes them
+        # wait for the write lock instead of failing immediately.
+        self.conn.execute("PRAGMA journal_mode=WAL")
         self._init_tables()
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        # Serializes use of self.conn by writes without group commit and by
+        # reads of an in-memory database.
+        self._conn_lock = threading.RLock()
+        self.writer = None
+        group_commit = config.get("group_commit", {})
+        if group_commit.get("enabled") and self.db_path != ":memory:":
+            self.writer = GroupCommitWriter(
+                self.db_path,
+                timeout=self.busy_timeout,
+                max_batch=group_commit.get("max_batch", 256),
+                max_delay=group_commit.get("max_delay_ms", 2) / 1000,
+            )
+
+    @contextlib.contextmanager
+    def _cursor(self):
+        """Yield a cursor for read-only queries.
+
+        Each thread gets its own query-only connection, so reads issued from
+        a thread pool run in parallel with each other and with the writer.
+        In-memory databases cannot be shared that way and read through
+        self.conn while holding its lock.
+        """
+        if self.db_path == ":memory:":
+            with self._conn_lock:
+                yield self.conn.cursor()
+            return
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path, timeout=self.busy_timeout,
+                check_same_thread=False
+            )
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        yield conn.cursor()
+
+    def _write(self, op):
+        """Run op(cursor) as a committed write and return its result.
+
+        With group commit enabled the operation is handed to the writer
+        thread and this call returns once the group containing it has been
+        committed; otherwise it runs and commits on the shared connection,
+        one operation at a time so that no commit or rollback lands in the
+        middle of another thread's transaction. Either way op runs inside
+        one BEGIN IMMEDIATE transaction, so its reads and writes are atomic
+        and its savepoints nest instead of committing on release.
+        """
+        if self.writer is not None:
+            return self.writer.execute(op)
+        with self._conn_lock:
+            c = self.conn.cursor()
+            try:
+                c.execute("BEGIN IMMEDIATE")
+                result = op(c)
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+            return result
 
     def _init_tables(self):
         """Create tables for nodes, jobs, results, and votes if they do not exist."""
@@ -23,6 +168,26 @@ class DB:
             profile TEXT
         )"""
         )
+        added = self._add_missing_columns(c, "nodes", {
+            **{
+                f"cap_{key}": decl
+                for key, decl in STRUCTURED_REQUIREMENTS.items()
+            },
+            "owner": "TEXT",
+        })
+        if "owner" in added:
+            c.execute(
+                "UPDATE nodes SET owner = json_extract(profile, '$.public_key')"
+            )
+        if added - {"owner"}:
+            c.execute("SELECT node_id, profile FROM nodes")
+            c.executemany(
+                "UPDATE nodes SET "
+                + ", ".join(f"{column} = ?" for column in CAPABILITY_COLUMNS)
+                + " WHERE node_id = ?",
+                [(*_capability_values(json.loads(profile)), node_id)
+                 for node_id, profile in c.fetchall()]
+            )
         c.execute(
             """CREATE TABLE IF NOT EXISTS jobs (
             job_id TEXT PRIMARY KEY,
@@ -31,6 +196,61 @@ class DB:
             status TEXT
         )"""
         )
+        added = self._add_missing_columns(c, "jobs", {
+            "submitted_at": "REAL",
+            "dispatch_rank": "REAL",
+            "submitter": "TEXT",
+            "finished_at": "REAL",
+            "est_flops": "REAL",
+            **{
+                f"req_{key}": decl if decl == "TEXT" else f"{decl} DEFAULT 0"
+                for key, decl in STRUCTURED_REQUIREMENTS.items()
+            },
+            "req_extra": "INTEGER DEFAULT 0",
+            "replicas": "INTEGER DEFAULT 1",
+            "speculated": "INTEGER DEFAULT 0",
+        })
+        if "dispatch_rank" in added:
+            # Jobs queued before ranking existed go first, in their original
+            # order.
+            c.execute(
+                "UPDATE jobs SET submitted_at = ?, dispatch_rank = rowid",
+                (time.time(),)
+            )
+        if "submitter" in added:
+            c.execute(
+                "UPDATE jobs SET submitter = json_extract(job, '$.submitter')"
+            )
+        if "req_extra" in added:
+            c.execute(
+                "SELECT job_id, job FROM jobs WHERE status != 'completed'"
+            )
+            c.executemany(
+                "UPDATE jobs SET "
+                + ", ".join(f"{column} = ?" for column in
+                            (*REQUIREMENT_COLUMNS, "req_extra"))
+                + " WHERE job_id = ?",
+                [(*_requirement_values(json.loads(job)), job_id)
+                 for job_id, job in c.fetchall()]
+            )
+        if "est_flops" in added:
+            c.execute(
+                "UPDATE jobs SET est_flops = COALESCE("
+                "json_extract(job, '$.estimated_flops'), "
+                "json_extract(job, '$.execution.estimated_flops'), 0)"
+            )
+        if "replicas" in added:
+            c.execute(
+                "UPDATE jobs SET replicas = ? WHERE status != 'completed'",
+                (self.replicas,)
+            )
+        if "finished_at" in added:
+            # Completion times were not recorded before; start the
+            # compaction clock for existing finished jobs now.
+            c.execute(
+                "UPDATE jobs SET finished_at = ? WHERE status = 'completed'",
+                (time.time(),)
+            )
         c.execute(
             """CREATE TABLE IF NOT EXISTS results (
             job_id TEXT,
@@ -46,158 +266,1117 @@ class DB:
             result TEXT
         )"""
         )
-        self.conn.commit()
-
-    def register_node(self, profile):
-        """Register a new node profile and return its generated node_id."""
-        node_id = os.urandom(8).hex()
-        c = self.conn.cursor()
         c.execute(
-            "INSERT INTO nodes (node_id, profile) VALUES (?, ?)",
-            (node_id, json.dumps(profile))
+            """CREATE TABLE IF NOT EXISTS vote_tally (
+            job_id TEXT,
+            sha256 TEXT,
+            votes INTEGER,
+            PRIMARY KEY (job_id, sha256)
+        )"""
         )
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS leases (
+            job_id TEXT,
+            node_id TEXT,
+            leased_at REAL,
+            expires_at REAL,
+            PRIMARY KEY (job_id, node_id)
+        )"""
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_leases_expires "
+            "ON leases (expires_at)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_leases_node "
+            "ON leases (node_id)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_leases_leased "
+            "ON leases (leased_at)"
+        )
+        # One row per node running or having delivered a replica of an
+        # unfinished job. The unique owner index is the anti-affinity rule:
+        # nodes registered under one key never fill two slots of a job.
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS replica_slots (
+            job_id TEXT,
+            node_id TEXT,
+            owner TEXT,
+            delivered INTEGER DEFAULT 0,
+            PRIMARY KEY (job_id, node_id)
+        )"""
+        )
+        c.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_replica_slots_owner "
+            "ON replica_slots (job_id, owner)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_replica_slots_node "
+            "ON replica_slots (node_id)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_replica_slots_holder "
+            "ON replica_slots (owner)"
+        )
+        # Measured node throughput (FLOPs/s), kept across restarts.
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS node_perf (
+            node_id TEXT PRIMARY KEY,
+            flops REAL,
+            samples INTEGER,
+            updated_at REAL
+        )"""
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_node_perf_flops "
+            "ON node_perf (flops)"
+        )
+        # The last runtime_window lease-to-vote times of each job type, as
+        # a ring indexed by the type's sample count.
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS runtime_stats (
+            job_type TEXT PRIMARY KEY,
+            samples INTEGER
+        )"""
+        )
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS runtime_samples (
+            job_type TEXT,
+            slot INTEGER,
+            seconds REAL,
+            PRIMARY KEY (job_type, slot)
+        )"""
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_runtime_samples_seconds "
+            "ON runtime_samples (job_type, seconds)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_results_job ON results (job_id)"
+        )
+        self._init_archive(c)
+        self._init_change_feed(c)
+        # Partial index holding only the pending queue, so claims stay
+        # cheap no matter how many finished jobs the table accumulates.
+        # Queries must use the literal 'pending' for SQLite to pick it.
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_pending "
+            "ON jobs (job_id) WHERE status = 'pending'"
+        )
+        # Dispatch order of the pending queue; see Server.priority.
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_pending_rank "
+            "ON jobs (dispatch_rank) WHERE status = 'pending'"
+        )
+        # Pending jobs by GPU demand, so GPU-less nodes skip GPU work
+        # without walking past it; see claim_matching.
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_pending_gpu "
+            "ON jobs (req_gpu_count, dispatch_rank) WHERE status = 'pending'"
+        )
+        # Keyset pagination with status or submitter filters.
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_status "
+            "ON jobs (status, job_id)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_submitter "
+            "ON jobs (submitter, job_id)"
+        )
+        # Finished jobs in completion order, for compaction.
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_finished "
+            "ON jobs (finished_at) WHERE status = 'completed'"
+        )
+        self._migrate(c)
         self.conn.commit()
-        return node_id
 
-    def add_job(self, job):
-        """Insert a new job with pending status."""
-        c = self.conn.cursor()
+    def _migrate(self, c):
+        """Apply one-off data migrations tracked in PRAGMA user_version.
+
+        Each step is idempotent, so coordinators starting side by side on
+        an old database cannot corrupt it by both running a step.
+        """
+        c.execute("PRAGMA user_version")
+        version = c.fetchone()[0]
+        if version < 1:
+            # One vote per (job, hash, node), and quorum counts kept in
+            # vote_tally instead of COUNT(DISTINCT) over votes.
+            c.execute(
+                "DELETE FROM votes WHERE rowid NOT IN (SELECT MIN(rowid) "
+                "FROM votes GROUP BY job_id, sha256, node_id)"
+            )
+            c.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_votes_node "
+                "ON votes (job_id, sha256, node_id)"
+            )
+            c.execute(
+                "INSERT OR REPLACE INTO vote_tally (job_id, sha256, votes) "
+                "SELECT job_id, sha256, COUNT(*) FROM votes "
+                "GROUP BY job_id, sha256"
+            )
+            c.execute("PRAGMA user_version = 1")
+        if version < 2:
+            # Leases granted before replica slots existed each hold a slot;
+            # jobs with slots left over go back to the queue to fill them.
+            c.execute(
+                "INSERT OR IGNORE INTO replica_slots (job_id, node_id, owner) "
+                "SELECT leases.job_id, leases.node_id, nodes.owner FROM leases "
+                "LEFT JOIN nodes ON nodes.node_id = leases.node_id"
+            )
+            c.execute(
+                "UPDATE jobs SET status = 'pending' WHERE status = 'assigned' "
+                "AND replicas > (SELECT COUNT(*) FROM replica_slots "
+                "WHERE replica_slots.job_id = jobs.job_id)"
+            )
+            c.execute("PRAGMA user_version = 2")
+
+    @staticmethod
+    def _init_archive(c):
+        """Create the cold tables that compacted jobs and results move to.
+
+        Only finished work lives here, so the hot jobs, results and votes
+        tables hold the live queue plus a short tail of recent results
+        and stay small enough to sit in the page cache.
+        """
         c.execute(
-            "INSERT INTO jobs (job_id, job, assigned_node, status) "
-            "VALUES (?, ?, ?, ?)",
-            (job["job_id"], json.dumps(job), None, "pending")
+            """CREATE TABLE IF NOT EXISTS jobs_archive (
+            job_id TEXT PRIMARY KEY,
+            job TEXT,
+            assigned_node TEXT,
+            status TEXT,
+            submitter TEXT,
+            submitted_at REAL,
+            finished_at REAL
+        )"""
+        )
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS results_archive (
+            job_id TEXT,
+            node_id TEXT,
+            result TEXT
+        )"""
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_archive_status "
+            "ON jobs_archive (status, job_id)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_archive_submitter "
+            "ON jobs_archive (submitter, job_id)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_results_archive_job "
+            "ON results_archive (job_id)"
         )
-        self.conn.commit()
 
-    def assign_job(self, node_id):
-        """Assign the first pending job to the given node."""
-        c = self.conn.cursor()
+    @staticmethod
+    def _init_change_feed(c):
+        """Create the change log and the triggers that feed it.
+
+        Triggers run inside the writing transaction, so every job or node
+        transition gets a sequence number no matter which connection or
+        coordinator process made it, and a change is visible exactly when
+        the state it describes is.
+        """
         c.execute(
-            "SELECT job_id, job FROM jobs WHERE status = ? LIMIT 1",
-            ("pending",)
+            """CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT,
+            entity_id TEXT,
+            status TEXT,
+            assigned_node TEXT,
+            data TEXT
+        )"""
         )
-        row = c.fetchone()
-        if row:
-            job_id, job_json = row
+        c.execute(
+            """CREATE TRIGGER IF NOT EXISTS changes_job_insert
+            AFTER INSERT ON jobs BEGIN
+                INSERT INTO changes (kind, entity_id, status, assigned_node)
+                VALUES ('job', NEW.job_id, NEW.status, NEW.assigned_node);
+            END"""
+        )
+        c.execute(
+            """CREATE TRIGGER IF NOT EXISTS changes_job_update
+            AFTER UPDATE OF status, assigned_node ON jobs
+            WHEN OLD.status IS NOT NEW.status
+                OR OLD.assigned_node IS NOT NEW.assigned_node
+            BEGIN
+                INSERT INTO changes (kind, entity_id, status, assigned_node)
+                VALUES ('job', NEW.job_id, NEW.status, NEW.assigned_node);
+            END"""
+        )
+        c.execute(
+            """CREATE TRIGGER IF NOT EXISTS changes_node_insert
+            AFTER INSERT ON nodes BEGIN
+                INSERT INTO changes (kind, entity_id, status, data)
+                VALUES ('node', NEW.node_id, 'registered', NEW.profile);
+            END"""
+        )
+
+    @staticmethod
+    def _add_missing_columns(c, table, columns):
+        """Add columns introduced after ``table`` was first created.
+
+        Returns the set of column names that had to be added.
+        """
+        c.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in c.fetchall()}
+        added = set()
+        for name, decl in columns.items():
+            if name not in existing:
+                c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+                added.add(name)
+        return added
+
+    def register_node(self, profile):
+        """Register a new node profile and return its generated node_id."""
+        node_id = os.urandom(8).hex()
+
+        columns = ", ".join(
+            ("node_id", "profile", "owner", *CAPABILITY_COLUMNS)
+        )
+        placeholders = ", ".join("?" * (3 + len(CAPABILITY_COLUMNS)))
+
+        def op(c):
             c.execute(
-                "UPDATE jobs SET assigned_node = ?, status = ? WHERE job_id = ?",
-                (node_id, "assigned", job_id)
+                f"INSERT INTO nodes ({columns}) VALUES ({placeholders})",
+                (node_id, json.dumps(profile), node_owner(profile),
+                 *_capability_values(profile))
             )
-            self.conn.commit()
-            return json.loads(job_json)
-        return None
+        self._write(op)
+        return node_id
 
-    def store_result(self, result):
-        """Store job result and mark the job as completed."""
-        c = self.conn.cursor()
+    def add_job(self, job, rank=None):
+        """Insert a new job with pending status.
+
+        ``rank`` is the job's dispatch order key (lower is claimed first);
+        it defaults to the submission time, i.e. FIFO.
+        """
+        submitted_at = time.time()
+        if rank is None:
+            rank = submitted_at
+
+        def op(c):
+            c.execute(
+                _insert_jobs_sql("INSERT"),
+                _job_row(job, submitted_at, rank, self.replicas)
+            )
+            if c.rowcount == 0:
+                raise sqlite3.IntegrityError(
+                    f"Job {job['job_id']} is already archived"
+                )
+        self._write(op)
+
+    def add_jobs(self, jobs, ranks=None):
+        """Insert many pending jobs in one transaction.
+
+        ``ranks`` optionally gives each job's dispatch order key, as for
+        add_job. Jobs whose job_id already exists, hot or archived, are
+        skipped. Returns the
+        number of rows actually inserted.
+        """
+        submitted_at = time.time()
+        if ranks is None:
+            ranks = [submitted_at] * len(jobs)
+        rows = [
+            _job_row(job, submitted_at, rank, self.replicas)
+            for job, rank in zip(jobs, ranks)
+        ]
+
+        def op(c):
+            c.executemany(_insert_jobs_sql("INSERT OR IGNORE"), rows)
+            return c.rowcount
+        return self._write(op)
+
+    def _grant_leases(self, c, job_ids, node_id):
+        """Record a lease for each job just assigned to the node."""
+        now = time.time()
+        c.executemany(
+            "INSERT OR REPLACE INTO leases "
+            "(job_id, node_id, leased_at, expires_at) VALUES (?, ?, ?, ?)",
+            [(job_id, node_id, now, now + self.lease_seconds)
+             for job_id in job_ids]
+        )
+
+    def _take_slots(self, c, job_ids, node_id):
+        """Give the node a replica slot of each job and lease it the jobs.
+
+        A job is skipped if it is no longer pending or if the node, or
+        another node with the same owner, already holds one of its slots.
+        A job stays pending until all its ``replicas`` slots are taken, so
+        the other replicas can be dispatched alongside this one. Returns
+        (job_id, job JSON) for every job the node got.
+        """
+        placeholders = ", ".join("?" * len(job_ids))
         c.execute(
-            "INSERT INTO results (job_id, node_id, result) VALUES (?, ?, ?)",
-            (result["job_id"], result.get("node_id", ""), json.dumps(result))
+            "INSERT OR IGNORE INTO replica_slots (job_id, node_id, owner) "
+            "SELECT job_id, ?, (SELECT owner FROM nodes WHERE node_id = ?) "
+            f"FROM jobs WHERE job_id IN ({placeholders}) "
+            "AND status = 'pending' RETURNING job_id",
+            (node_id, node_id, *job_ids)
         )
+        taken = [row[0] for row in c.fetchall()]
+        if not taken:
+            return []
         c.execute(
-            "UPDATE jobs SET status = ? WHERE job_id = ?",
-            ("completed", result["job_id"])
+            "UPDATE jobs SET assigned_node = ?, status = CASE WHEN replicas "
+            "<= (SELECT COUNT(*) FROM replica_slots "
+            "WHERE replica_slots.job_id = jobs.job_id) "
+            "THEN 'assigned' ELSE 'pending' END "
+            f"WHERE job_id IN ({', '.join('?' * len(taken))}) "
+            "RETURNING job_id, job",
+            (node_id, *taken)
         )
-        self.conn.commit()
+        rows = c.fetchall()
+        self._grant_leases(c, [job_id for job_id, _ in rows], node_id)
+        return rows
 
-    def add_vote(self, result):
-        """Record a vote for a job result from a node."""
-        c = self.conn.cursor()
+    @staticmethod
+    def _committed(c, node_id):
+        """Return the packed demand of every job currently leased to a node."""
         c.execute(
-            "INSERT INTO votes (job_id, sha256, node_id, result) "
-            "VALUES (?, ?, ?, ?)",
-            (result["job_id"], result["sha256"], result.get("node_id", ""),
-             json.dumps(result))
+            f"SELECT {DEMAND_COLUMNS} FROM leases "
+            "JOIN jobs ON jobs.job_id = leases.job_id WHERE leases.node_id = ?",
+            (node_id,)
         )
-        self.conn.commit()
+        return [
+            packed_demand(dict(zip(PACKED_RESOURCES, row)))
+            for row in c.fetchall()
+        ]
 
-    def count_votes(self, job_id, sha256):
-        """Count distinct votes for a given job_id and hash."""
-        c = self.conn.cursor()
+    def get_committed(self, node_id):
+        """Return the demand of the node's leased jobs, for free_capacity."""
+        with self._cursor() as c:
+            return self._committed(c, node_id)
+
+    def get_held(self, node_id):
+        """Return the pending jobs whose slot the node or its owner holds.
+
+        These are the jobs _take_slots would refuse the node, so the
+        scheduler leaves them in its index when the node polls.
+        """
+        with self._cursor() as c:
+            c.execute(
+                "SELECT job_id FROM jobs WHERE status = 'pending' "
+                "AND job_id IN (SELECT job_id FROM replica_slots "
+                "WHERE node_id = ? UNION SELECT job_id FROM replica_slots "
+                "WHERE owner = (SELECT owner FROM nodes WHERE node_id = ?))",
+                (node_id, node_id)
+            )
+            return {row[0] for row in c.fetchall()}
+
+    def _node_capacity(self, c, node_id):
+        """Return the node's free capacity, or None if it is not packed.
+
+        Runs on the cursor of a _write operation, whose BEGIN IMMEDIATE
+        holds the write lock from this read until commit, so the result
+        cannot be invalidated by a concurrent claim in between.
+        """
+        if not self.bin_packing:
+            return None
+        c.execute("SELECT profile FROM nodes WHERE node_id = ?", (node_id,))
+        row = c.fetchone()
+        if row is None:
+            return None
+        return free_capacity(json.loads(row[0]), self._committed(c, node_id))
+
+    def _fitting(self, c, job_ids, node_id):
+        """Return the job_ids, in order, that fit on the node together.
+
+        Jobs are taken greedily; one that does not fit in what is left is
+        skipped and the rest are still considered.
+        """
+        capacity = self._node_capacity(c, node_id)
+        if capacity is None:
+            return job_ids
         c.execute(
-            "SELECT COUNT(DISTINCT node_id) FROM votes "
-            "WHERE job_id = ? AND sha256 = ?",
-            (job_id, sha256)
+            f"SELECT job_id, {DEMAND_COLUMNS} FROM jobs "
+            f"WHERE job_id IN ({', '.join('?' * len(job_ids))})",
+            job_ids
         )
-        row = c.fetchone()
-        return row[0] if row else 0
+        demands = {
+            row[0]: packed_demand(dict(zip(PACKED_RESOURCES, row[1:])))
+            for row in c.fetchall()
+        }
+        chosen = []
+        for job_id in job_ids:
+            demand = demands.get(job_id)
+            if demand is not None and fits(demand, capacity):
+                consume(capacity, demand)
+                chosen.append(job_id)
+        return chosen
 
-    def get_vote_result(self, job_id, sha256):
-        """Retrieve the recorded result for a job and hash."""
-        c = self.conn.cursor()
+    def assign_job(self, node_id):
+        """Atomically claim the lowest-ranked pending job the node can run."""
+        jobs = self.claim_matching(node_id, 1)
+        return jobs[0] if jobs else None
+
+    def claim_matching(self, node_id, limit, page_size=256):
+        """Claim up to ``limit`` pending jobs the node can run, in rank order.
+
+        Eligibility is filtered in SQL on the typed requirement columns
+        against the node's capability columns; only jobs flagged
+        ``req_extra`` have their JSON requirements rechecked in Python.
+        Selection and claim share one BEGIN IMMEDIATE transaction (see
+        _write), so no other writer can take the selected jobs in between.
+        """
+        def op(c):
+            c.execute(
+                f"SELECT profile, {', '.join(CAPABILITY_COLUMNS)} "
+                "FROM nodes WHERE node_id = ?",
+                (node_id,)
+            )
+            row = c.fetchone()
+            if row is None:
+                return []
+            profile = json.loads(row[0])
+            capabilities = dict(zip(STRUCTURED_REQUIREMENTS, row[1:]))
+            capacity = self._node_capacity(c, node_id)
+            where, params = ["status = 'pending'"], []
+            # Skip jobs whose replica this node or its owner already runs.
+            where.append(
+                "NOT EXISTS (SELECT 1 FROM replica_slots "
+                "WHERE replica_slots.job_id = jobs.job_id "
+                "AND (replica_slots.node_id = ? OR replica_slots.owner = ?))"
+            )
+            params.extend((node_id, node_owner(profile)))
+            for key, decl in STRUCTURED_REQUIREMENTS.items():
+                value = capabilities[key]
+                if decl == "TEXT":
+                    where.append(f"(req_{key} IS NULL OR req_{key} = ?)")
+                elif key == "gpu_count" and not value:
+                    # Equality lets SQLite walk idx_jobs_pending_gpu in
+                    # rank order.
+                    where.append("req_gpu_count = 0")
+                    continue
+                else:
+                    where.append(f"req_{key} <= ?")
+                    value = value or 0
+                params.append(value)
+            select = c.connection.execute(
+                f"SELECT job_id, job, req_extra, {DEMAND_COLUMNS} FROM jobs "
+                f"WHERE {' AND '.join(where)} ORDER BY dispatch_rank",
+                params
+            )
+            chosen = []
+            # Every job needs a core, so a full node can stop looking.
+            while len(chosen) < limit and (
+                capacity is None or capacity["cores"] >= 1
+            ):
+                rows = select.fetchmany(page_size)
+                if not rows:
+                    break
+                for job_id, job_json, extra, *demand in rows:
+                    if extra and not meets_requirements(
+                        profile, json.loads(job_json).get("requirements", {})
+                    ):
+                        continue
+                    if capacity is not None:
+                        demand = packed_demand(
+                            dict(zip(PACKED_RESOURCES, demand))
+                        )
+                        if not fits(demand, capacity):
+                            continue
+                        consume(capacity, demand)
+                    chosen.append(job_id)
+                    if len(chosen) == limit:
+                        break
+            select.close()
+            if not chosen:
+                return []
+            return self._take_slots(c, chosen, node_id)
+        return [json.loads(job) for _, job in self._write(op)]
+
+    def claim_job(self, job_id, node_id):
+        """Claim a replica slot of a specific job if one is still open.
+
+        The slot check and the claim are one transaction, so when several
+        threads or coordinator processes race for the last slot exactly
+        one of them gets the job back; the others receive None.
+        """
+        jobs = self.claim_jobs([job_id], node_id)
+        return jobs[0] if jobs else None
+
+    def claim_jobs(self, job_ids, node_id):
+        """Claim a replica slot of every still-pending job in job_ids.
+
+        Runs in one transaction. Returns the claimed job dicts; ids that
+        were no longer pending, whose replica the node (or its owner)
+        already holds, or that would overcommit the node with bin_packing
+        enabled, are silently left out.
+        """
+        if not job_ids:
+            return []
+
+        def op(c):
+            fitting = self._fitting(c, job_ids, node_id)
+            if not fitting:
+                return []
+            return self._take_slots(c, fitting, node_id)
+        return [json.loads(row[1]) for row in self._write(op)]
+
+    def renew_leases(self, node_id, job_ids=None):
+        """Extend the node's leases and return the job_ids still held.
+
+        With job_ids omitted every lease held by the node is renewed. Jobs
+        missing from the returned list are no longer leased to the node
+        (expired and reclaimed, or already finalized).
+        """
+        expires_at = time.time() + self.lease_seconds
+
+        def op(c):
+            if job_ids is None:
+                c.execute(
+                    "UPDATE leases SET expires_at = ? WHERE node_id = ? "
+                    "RETURNING job_id",
+                    (expires_at, node_id)
+                )
+            else:
+                placeholders = ", ".join("?" * len(job_ids))
+                c.execute(
+                    "UPDATE leases SET expires_at = ? WHERE node_id = ? "
+                    f"AND job_id IN ({placeholders}) RETURNING job_id",
+                    (expires_at, node_id, *job_ids)
+                )
+            return [row[0] for row in c.fetchall()]
+        if job_ids is not None and not job_ids:
+            return []
+        return self._write(op)
+
+    def reclaim_expired_leases(self, now=None, limit=1000):
+        """Drop up to ``limit`` expired leases and requeue their jobs.
+
+        Each call is a single transaction. An expired lease frees its
+        replica slot, and the job is pending again until another node
+        takes it. Jobs keep their original dispatch rank, so reclaimed work
+        goes back near the front of the queue. Returns (job_id, job dict,
+        dispatch rank) for every job that has an open slot again.
+        """
+        now = time.time() if now is None else now
+
+        def op(c):
+            c.execute(
+                "DELETE FROM leases WHERE rowid IN (SELECT rowid FROM leases "
+                "WHERE expires_at < ? LIMIT ?) RETURNING job_id, node_id",
+                (now, limit)
+            )
+            expired = c.fetchall()
+            if not expired:
+                return []
+            c.executemany(
+                "DELETE FROM replica_slots WHERE job_id = ? AND node_id = ? "
+                "AND NOT delivered",
+                expired
+            )
+            job_ids = list({job_id for job_id, _ in expired})
+            placeholders = ", ".join("?" * len(job_ids))
+            c.execute(
+                "UPDATE jobs SET status = 'pending', assigned_node = NULL "
+                f"WHERE job_id IN ({placeholders}) "
+                "AND status IN ('pending', 'assigned') "
+                "AND replicas > (SELECT COUNT(*) FROM replica_slots "
+                "WHERE replica_slots.job_id = jobs.job_id) "
+                "RETURNING job_id, job, dispatch_rank",
+                job_ids
+            )
+            return c.fetchall()
+        return [
+            (job_id, json.loads(job_json), rank)
+            for job_id, job_json, rank in self._write(op)
+        ]
+
+    def _insert_vote(self, c, result):
+        """Insert a vote and bump its tally in the same transaction.
+
+        Returns (votes for the job and hash, whether the vote was new). A
+        repeated vote from the same node is ignored by the unique index
+        and leaves the tally unchanged.
+        """
+        node_id = result.get("node_id", "")
         c.execute(
-            "SELECT result FROM votes "
-            "WHERE job_id = ? AND sha256 = ? LIMIT 1",
-            (job_id, sha256)
+            "INSERT OR IGNORE INTO votes (job_id, sha256, node_id, result) "
+            "VALUES (?, ?, ?, ?)",
+            (result["job_id"], result["sha256"], node_id, json.dumps(result))
         )
-        row = c.fetchone()
-        return json.loads(row[0]) if row else None
+        new = c.rowcount == 1
+        # The node has delivered, so its lease on the job is done.
+        c.execute(
+            "DELETE FROM leases WHERE job_id = ? AND node_id = ? "
+            "RETURNING leased_at",
+            (result["job_id"], node_id)
+        )
+        lease = c.fetchone()
+        if new and lease:
+            self._observe_throughput(c, result["job_id"], node_id, lease[0])
+        if new:
+            c.execute(
+                "UPDATE replica_slots SET delivered = 1 "
+                "WHERE job_id = ? AND node_id = ?",
+                (result["job_id"], node_id)
+            )
+            c.execute(
+                "INSERT INTO vote_tally (job_id, sha256, votes) "
+                "VALUES (?, ?, 1) ON CONFLICT (job_id, sha256) "
+                "DO UPDATE SET votes = votes + 1 RETURNING votes",
+                (result["job_id"], result["sha256"])
+            )
+        else:
+            c.execute(
+                "SELECT votes FROM vote_tally WHERE job_id = ? AND sha256 = ?",
+                (result["job_id"], result["sha256"])
+            )
+        return c.fetchone()[0], new
 
-    def finalize_job(self, result):
-        """Finalize a job by storing its final result."""
-        self.store_result(result)
+    def _observe_throughput(self, c, job_id, node_id, leased_at):
+        """Update the node's FLOPs/s estimate from a job it just finished.
 
-    def get_node_profile(self, node_id):
-        """Retrieve stored node profile for a given node_id."""
-        c = self.conn.cursor()
+        The sample is the job's estimated FLOPs over the time since it was
+        leased, so it includes transfer and queueing on the node, which is
+        what completion time is made of. The same time is recorded as a
+        runtime sample of the job's type.
+        """
+        now = time.time()
         c.execute(
-            "SELECT profile FROM nodes WHERE node_id = ?",
-            (node_id,)
+            "SELECT est_flops, json_extract(job, '$.type') FROM jobs "
+            "WHERE job_id = ?",
+            (job_id,)
         )
         row = c.fetchone()
-        return json.loads(row[0]) if row else None
-
-    def get_pending_jobs(self):
-        """Return a list of (job_id, job dict) for all pending jobs."""
-        c = self.conn.cursor()
+        if not row or now <= leased_at:
+            return
+        self._record_runtime(c, row[1], now - leased_at)
+        if not row[0]:
+            return
+        c.execute("SELECT flops FROM node_perf WHERE node_id = ?", (node_id,))
+        previous = c.fetchone()
+        flops = updated_estimate(
+            previous[0] if previous else None, row[0] / (now - leased_at),
+            self.perf_alpha
+        )
         c.execute(
-            "SELECT job_id, job FROM jobs WHERE status = ?",
-            ("pending",)
+            "INSERT INTO node_perf (node_id, flops, samples, updated_at) "
+            "VALUES (?, ?, 1, ?) ON CONFLICT (node_id) DO UPDATE SET "
+            "flops = excluded.flops, samples = samples + 1, "
+            "updated_at = excluded.updated_at",
+            (node_id, flops, now)
         )
-        rows = c.fetchall()
-        return [(job_id, json.loads(job_json)) for job_id, job_json in rows]
 
-    def get_all_jobs(self):
-        """Return a list of all jobs."""
-        c = self.conn.cursor()
+    def _record_runtime(self, c, job_type, seconds):
+        """Add a runtime sample, replacing the type's oldest when full."""
         c.execute(
-            "SELECT job_id, job, assigned_node, status FROM jobs"
+            "INSERT INTO runtime_stats (job_type, samples) VALUES (?, 1) "
+            "ON CONFLICT (job_type) DO UPDATE SET samples = samples + 1 "
+            "RETURNING samples",
+            (job_type or "",)
         )
-        rows = c.fetchall()
+        c.execute(
+            "INSERT OR REPLACE INTO runtime_samples (job_type, slot, seconds) "
+            "VALUES (?, ?, ?)",
+            (job_type or "", c.fetchone()[0] % self.runtime_window, seconds)
+        )
+
+    def get_runtime_quantile(self, job_type, quantile, min_samples=1):
+        """Return a quantile of the job type's recent runtimes in seconds.
+
+        None while fewer than ``min_samples`` runs have been observed.
+        """
+        with self._cursor() as c:
+            c.execute(
+                "SELECT COUNT(*) FROM runtime_samples WHERE job_type = ?",
+                (job_type or "",)
+            )
+            count = c.fetchone()[0]
+            if not count or count < min_samples:
+                return None
+            c.execute(
+                "SELECT seconds FROM runtime_samples WHERE job_type = ? "
+                "ORDER BY seconds LIMIT 1 OFFSET ?",
+                (job_type or "", round((count - 1) * quantile))
+            )
+            return c.fetchone()[0]
+
+    def get_running_replicas(self, leased_before, max_speculated, limit=1000):
+        """Return replicas leased before ``leased_before`` and not delivered.
+
+        Only jobs with every slot taken and fewer than ``max_speculated``
+        speculative copies are included, oldest lease first. Each entry is
+        (job_id, job type, estimated FLOPs, leased_at, the node's measured
+        FLOPs/s or None).
+        """
+        with self._cursor() as c:
+            c.execute(
+                "SELECT leases.job_id, json_extract(jobs.job, '$.type'), "
+                "jobs.est_flops, leases.leased_at, node_perf.flops FROM leases "
+                "JOIN jobs ON jobs.job_id = leases.job_id "
+                "LEFT JOIN node_perf ON node_perf.node_id = leases.node_id "
+                "WHERE leases.leased_at < ? AND jobs.status = 'assigned' "
+                "AND jobs.speculated < ? ORDER BY leases.leased_at LIMIT ?",
+                (leased_before, max_speculated, limit)
+            )
+            return c.fetchall()
+
+    def add_speculative_replicas(self, job_ids, max_speculated):
+        """Open one more replica slot on each of the straggling jobs.
+
+        Jobs that finished or reached ``max_speculated`` copies meanwhile
+        are skipped. Returns (job_id, job dict, dispatch rank) for every
+        job that is pending again.
+        """
+        if not job_ids:
+            return []
+
+        def op(c):
+            c.execute(
+                "UPDATE jobs SET replicas = replicas + 1, "
+                "speculated = speculated + 1, status = 'pending' "
+                f"WHERE job_id IN ({', '.join('?' * len(job_ids))}) "
+                "AND status = 'assigned' AND speculated < ? "
+                "RETURNING job_id, job, dispatch_rank",
+                (*job_ids, max_speculated)
+            )
+            return c.fetchall()
         return [
-            {
-                "job_id": row[0],
-                "job": json.loads(row[1]),
-                "assigned_node": row[2],
-                "status": row[3],
-            }
-            for row in rows
+            (job_id, json.loads(job_json), rank)
+            for job_id, job_json, rank in self._write(op)
         ]
 
-    def assign_job_to_node(self, job_id, node_id):
-        """Mark a job as assigned to a specific node."""
-        c = self.conn.cursor()
+    def get_node_flops(self, node_id):
+        """Return the node's measured FLOPs/s, or None if never measured."""
+        with self._cursor() as c:
+            c.execute("SELECT flops FROM node_perf WHERE node_id = ?", (node_id,))
+            row = c.fetchone()
+            return row[0] if row else None
+
+    def get_fleet_flops(self, quantile):
+        """Return the given quantile of measured node FLOPs/s, or None."""
+        with self._cursor() as c:
+            c.execute(
+                "SELECT flops FROM node_perf ORDER BY flops LIMIT 1 OFFSET "
+                "(SELECT CAST(ROUND((COUNT(*) - 1) * ?) AS INTEGER) FROM node_perf)",
+                (quantile,)
+            )
+            row = c.fetchone()
+            return row[0] if row else None
+
+    def record_votes(self, results, quorum):
+        """Record many votes and finalize every job that reaches quorum.
+
+        All votes, quorum checks and finalizations happen in one
+        transaction. Returns one ``{"job_id", "status", "votes"}`` dict per
+        result, in order; status is "finalized" for the vote that completed
+        its job, "duplicate vote" for a node repeating its vote and "vote
+        recorded" otherwise. A finalized outcome carries the job's
+        ``completion_seconds`` since submission. A recorded vote carries
+        ``reopened``, true when all of the job's replicas have reported
+        without a quorum and a further replica slot was opened. A malformed
+        result is rolled back on its own and reported as "rejected".
+        """
+        def op(c):
+            outcomes = []
+            for result in results:
+                # Nested in _write's transaction: releasing the savepoint
+                # does not commit, the whole batch commits once.
+                c.execute("SAVEPOINT vote")
+                try:
+                    outcomes.append(self._record_vote(c, result, quorum))
+                except (KeyError, TypeError, sqlite3.Error) as e:
+                    c.execute("ROLLBACK TO vote")
+                    outcomes.append({
+                        "job_id": result.get("job_id"),
+                        "status": "rejected",
+                        "error": f"Could not record vote: {e!r}",
+                    })
+                c.execute("RELEASE vote")
+            return outcomes
+        return self._write(op)
+
+    def _record_vote(self, c, result, quorum):
+        """Insert one vote and finalize its job if that reaches quorum."""
+        job_id = result["job_id"]
+        c.execute("SELECT 1 FROM jobs_archive WHERE job_id = ?", (job_id,))
+        if c.fetchone():
+            # Compacted jobs keep no votes; a straggler cannot reopen them.
+            return {"job_id": job_id, "status": "already finalized",
+                    "votes": None}
+        votes, new = self._insert_vote(c, result)
+        if not new:
+            return {"job_id": job_id, "status": "duplicate vote", "votes": votes}
+        if votes >= quorum:
+            now = time.time()
+            c.execute(
+                "UPDATE jobs SET status = 'completed', finished_at = ? "
+                "WHERE job_id = ? AND status != 'completed' "
+                "RETURNING submitted_at",
+                (now, job_id)
+            )
+            finished = c.fetchone()
+            if finished:
+                c.execute(
+                    "INSERT INTO results (job_id, node_id, result) "
+                    "SELECT job_id, node_id, result FROM votes "
+                    "WHERE job_id = ? AND sha256 = ? LIMIT 1",
+                    (job_id, result["sha256"])
+                )
+                for table in ("leases", "replica_slots"):
+                    c.execute(
+                        f"DELETE FROM {table} WHERE job_id = ?", (job_id,)
+                    )
+                return {"job_id": job_id, "status": "finalized",
+                        "votes": votes,
+                        "completion_seconds": now - (finished[0] or now)}
+        # Every replica reported without reaching quorum: open one more
+        # slot so another node can break the tie.
         c.execute(
-            "UPDATE jobs SET assigned_node = ?, status = ? WHERE job_id = ?",
-            (node_id, "assigned", job_id)
+            "UPDATE jobs SET replicas = replicas + 1, status = 'pending' "
+            "WHERE job_id = ? AND status != 'completed' "
+            "AND replicas <= (SELECT COUNT(*) FROM replica_slots "
+            "WHERE replica_slots.job_id = jobs.job_id AND delivered) "
+            "RETURNING job_id",
+            (job_id,)
         )
-        self.conn.commit()
+        return {"job_id": job_id, "status": "vote recorded", "votes": votes,
+                "reopened": c.fetchone() is not None}
+
+    def compact_finished(self, before, limit=500):
+        """Move up to ``limit`` jobs completed before ``before`` to the archive.
+
+        Each job's row and final result are copied to jobs_archive and
+        results_archive, and its hot rows, including every vote and tally,
+        are deleted in the same transaction. The votes are superseded by
+        the stored result, so they are not kept. Returns the number of
+        jobs archived.
+        """
+        columns = ", ".join(ARCHIVE_COLUMNS)
+
+        def op(c):
+            c.execute(
+                "SELECT job_id FROM jobs WHERE status = 'completed' "
+                "AND finished_at < ? ORDER BY finished_at LIMIT ?",
+                (before, limit)
+            )
+            job_ids = [row[0] for row in c.fetchall()]
+            if not job_ids:
+                return 0
+            placeholders = ", ".join("?" * len(job_ids))
+            c.execute(
+                f"INSERT OR REPLACE INTO jobs_archive ({columns}) "
+                f"SELECT {columns} FROM jobs WHERE job_id IN ({placeholders})",
+                job_ids
+            )
+            c.execute(
+                "INSERT INTO results_archive (job_id, node_id, result) "
+                "SELECT job_id, node_id, result FROM results "
+                f"WHERE job_id IN ({placeholders})",
+                job_ids
+            )
+            for table in ("results", "votes", "vote_tally", "leases",
+                          "replica_slots", "jobs"):
+                c.execute(
+                    f"DELETE FROM {table} WHERE job_id IN ({placeholders})",
+                    job_ids
+                )
+            return len(job_ids)
+        return self._write(op)
+
+    def trim_changes(self, keep):
+        """Delete all but the newest ``keep`` change feed entries.
+
+        Returns the number of entries removed. Consumers whose cursor falls
+        before the remaining entries are told to resync by get_changes.
+        """
+        def op(c):
+            c.execute(
+                "DELETE FROM changes WHERE seq <= "
+                "(SELECT MAX(seq) FROM changes) - ?",
+                (keep,)
+            )
+            return c.rowcount
+        return self._write(op)
+
+    def get_node_profile(self, node_id):
+        """Retrieve stored node profile for a given node_id."""
+        with self._cursor() as c:
+            c.execute(
+                "SELECT profile FROM nodes WHERE node_id = ?",
+                (node_id,)
+            )
+            row = c.fetchone()
+            return json.loads(row[0]) if row else None
+
+    def iter_pending_jobs(self, page_size=256):
+        """Yield (job_id, job dict, dispatch rank) for pending jobs.
+
+        Pages are fetched by keyset on the pending index, so a caller that
+        stops at the first match never reads the rest of the queue.
+        """
+        after = ""
+        while True:
+            # The cursor is released between pages so that callers may
+            # write while iterating.
+            with self._cursor() as c:
+                c.execute(
+                    "SELECT job_id, job, dispatch_rank FROM jobs "
+                    "WHERE status = 'pending' AND job_id > ? "
+                    "ORDER BY job_id LIMIT ?",
+                    (after, page_size)
+                )
+                rows = c.fetchall()
+            for job_id, job_json, rank in rows:
+                yield job_id, json.loads(job_json), rank
+            if len(rows) < page_size:
+                return
+            after = rows[-1][0]
+
+    def get_job(self, job_id):
+        """Return a job with its final result, from hot or archived storage.
+
+        The dict has the JOB_FIELDS plus ``result`` (None until the job is
+        finalized), or the method returns None for an unknown job_id.
+        """
+        with self._cursor() as c:
+            for jobs, results in (("jobs", "results"),
+                                  ("jobs_archive", "results_archive")):
+                c.execute(
+                    f"SELECT {', '.join(JOB_FIELDS)} FROM {jobs} WHERE job_id = ?",
+                    (job_id,)
+                )
+                row = c.fetchone()
+                if row is None:
+                    continue
+                job = dict(zip(JOB_FIELDS, row))
+                job["job"] = json.loads(job["job"])
+                c.execute(
+                    f"SELECT result FROM {results} WHERE job_id = ? LIMIT 1",
+                    (job_id,)
+                )
+                result = c.fetchone()
+                job["result"] = json.loads(result[0]) if result else None
+                return job
+            return None
+
+    def get_pending(self, job_ids):
+        """Return (job_id, job dict, dispatch rank) for ids still pending."""
+        if not job_ids:
+            return []
+        with self._cursor() as c:
+            c.execute(
+                "SELECT job_id, job, dispatch_rank FROM jobs "
+                f"WHERE job_id IN ({', '.join('?' * len(job_ids))}) "
+                "AND status = 'pending'",
+                job_ids
+            )
+            return [
+                (job_id, json.loads(job_json), rank)
+                for job_id, job_json, rank in c.fetchall()
+            ]
+
+    def list_jobs(self, after=None, limit=1000, status=None, submitter=None,
+                  fields=None):
+        """Return one page of jobs ordered by job_id.
+
+        Pass the last job_id of a page as ``after`` to fetch the next one;
+        each page is a single index range scan, whatever its position.
+        ``fields`` selects a subset of JOB_FIELDS, and the ``job`` JSON is
+        only decoded when it is requested. Archived jobs are merged in, so
+        callers see a single job history.
+        """
+        filters = {"status": status, "submitter": submitter}
+        return self._list_page(
+            ("jobs", "jobs_archive"), "job_id", fields or JOB_FIELDS,
+            JOB_FIELDS, ("job",), filters, after, limit
+        )
+
+    def list_nodes(self, after=None, limit=1000, fields=None):
+        """Return one page of nodes ordered by node_id, as for list_jobs."""
+        return self._list_page(
+            ("nodes",), "node_id", fields or NODE_FIELDS, NODE_FIELDS,
+            ("profile",), {}, after, limit
+        )
+
+    def _list_page(self, tables, key, fields, allowed, json_fields, filters,
+                   after, limit):
+        """Run a keyset-paginated listing query and build result dicts.
+
+        With several tables the same query runs on each and SQLite merges
+        the ordered index scans, stopping once the page is full.
+        """
+        unknown = set(fields) - set(allowed)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        # The key is always returned so callers can request the next page.
+        fields = [key] + [field for field in fields if field != key]
+        where, params = [], []
+        for column, value in filters.items():
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if after is not None:
+            where.append(f"{key} > ?")
+            params.append(after)
+        selects = []
+        for table in tables:
+            select = f"SELECT {', '.join(fields)} FROM {table}"
+            if where:
+                select += " WHERE " + " AND ".join(where)
+            selects.append(select)
+        sql = " UNION ALL ".join(selects) + f" ORDER BY {key} LIMIT ?"
+        with self._cursor() as c:
+            c.execute(sql, (*params * len(tables), limit))
+            decode = [field in json_fields for field in fields]
+            return [
+                {
+                    field: json.loads(value) if is_json and value else value
+                    for field, value, is_json in zip(fields, row, decode)
+                }
+                for row in c.fetchall()
+            ]
+
+    def get_changes(self, since=0, limit=1000):
+        """Return job and node transitions with a sequence number above since.
+
+        The result holds the ``changes`` (oldest first), ``last_seq`` to
+        pass as the next ``since``, and ``reset``, which is true when
+        entries after ``since`` have already been trimmed and the caller
+        must rebuild its view from the listing endpoints.
+        """
+        with self._cursor() as c:
+            c.execute(
+                "SELECT seq, kind, entity_id, status, assigned_node, data "
+                "FROM changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                (since, limit)
+            )
+            changes = [
+                {
+                    "seq": seq,
+                    "kind": kind,
+                    "id": entity_id,
+                    "status": status,
+                    "assigned_node": assigned_node,
+                    "data": json.loads(data) if data else None,
+                }
+                for seq, kind, entity_id, status, assigned_node, data
+                in c.fetchall()
+            ]
+            c.execute("SELECT MIN(seq), MAX(seq) FROM changes")
+            first, last = c.fetchone()
+            reset = first is not None and since < first - 1
+            if changes:
+                last = changes[-1]["seq"]
+            elif last is None or since > last:
+                last = since
+            return {"changes": changes, "last_seq": last, "reset": reset}
 
-    def get_all_nodes(self):
-        """Return a list of all registered nodes."""
-        c = self.conn.cursor()
-        c.execute("SELECT node_id, profile FROM nodes")
-        rows = c.fetchall()
-        return [
-            {
-                "node_id": row[0],
-                "profile": json.loads(row[1]),
-            }
-            for row in rows
-        ]
-    
     def close(self):
         """Safely closes the database connection."""
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        with self._readers_lock:
+            for reader in self._readers:
+                reader.close()
+            self._readers.clear()
         if self.conn:
             self.conn.close()
             self.conn = None
@@ -0,0 +1,257 @@
+"""
+Fair sharing of dispatch between submitters by deficit round-robin.
+"""
+import collections
+import functools
+import math
+import threading
+from Server.matcher import ShardedRequirementIndex
+from Infrastructure.perf_estimator import estimate_time
+
+
+# Queue of jobs whose descriptor names no submitter.
+ANONYMOUS = "anonymous"
+
+
+def submitter_of(job):
+    """Return the submitter a job is queued and accounted under."""
+    return job.get("submitter") or ANONYMOUS
+
+
+def job_cost(job, config):
+    """Return the work a job is charged, in reference-node seconds.
+
+    This is its estimate_time on a ``reference_node_flops`` machine, and
+    at least ``fair_share.min_cost_seconds`` so jobs without an estimate
+    are not free.
+    """
+    seconds = estimate_time(job, config.get("reference_node_flops", 1.0e12))
+    return max(seconds, config.get("fair_share", {}).get(
+        "min_cost_seconds", 1.0
+    ))
+
+
+class FairShareIndex:
+    """Pending jobs in one ShardedRequirementIndex per submitter.
+
+    Claims are served by deficit round-robin over the submitters that
+    have jobs queued: the submitter at the head of the ring is granted
+    ``quantum_seconds`` times its weight on each visit and keeps the head
+    while its deficit is positive, paying job_cost for every job popped.
+    A submitter's share of dispatched work therefore follows its weight
+    however many jobs it has queued, while within a submitter jobs still
+    go in dispatch rank order. Jobs are charged when popped, and the
+    charge is refunded through settle if the node then fails to claim
+    them.
+
+    Submitters with nothing the polling node can run are passed over for
+    that claim and keep their credit. Credit is capped at one quantum,
+    so a submitter that only rare nodes can serve does not bank a burst.
+    Exposes the same add/remove/take/peek_rank/pop_many interface as the
+    sharded index.
+    """
+
+    def __init__(self, shards, config):
+        fair_share = config.get("fair_share", {})
+        self.config = config
+        self.shards = shards
+        self.quantum = fair_share.get("quantum_seconds", 60)
+        self.default_weight = fair_share.get("default_weight", 1.0)
+        self.weights = fair_share.get("weights") or {}
+        if self.quantum <= 0 or min(
+            [self.default_weight, *self.weights.values()]
+        ) <= 0:
+            raise ValueError("fair_share quantum and weights must be positive")
+        self._lock = threading.Lock()
+        self._queues = {}
+        # job_id -> (submitter, cost) of every indexed job.
+        self._jobs = {}
+        # job_id -> (submitter, cost) of popped jobs not yet settled.
+        self._charged = {}
+        self._ring = collections.deque()
+        self._deficit = {}
+        # Whether the ring head has had its quantum for the current visit.
+        self._granted = False
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def weight(self, submitter):
+        """Return the submitter's configured weight."""
+        return self.weights.get(submitter, self.default_weight)
+
+    def add(self, job_id, job, rank):
+        """Queue a pending job under its submitter, as RequirementIndex.add."""
+        submitter = submitter_of(job)
+        cost = job_cost(job, self.config)
+        with self._lock:
+            queue = self._queues.get(submitter)
+            if queue is None:
+                queue = self._queues[submitter] = ShardedRequirementIndex(
+                    self.shards
+                )
+            if not queue.add(job_id, job, rank):
+                return False
+            self._jobs[job_id] = (submitter, cost)
+            if submitter not in self._deficit:
+                self._deficit[submitter] = 0.0
+                self._ring.append(submitter)
+        return True
+
+    def remove(self, job_id):
+        """Drop a job from its submitter's queue."""
+        with self._lock:
+            entry = self._jobs.pop(job_id, None)
+            if entry is not None:
+                self._queues[entry[0]].remove(job_id)
+
+    def take(self, job_id):
+        """Remove and charge a job chosen outside pop_many.
+
+        Jobs picked this way skip the rotation, so a submitter may run up
+        to one quantum into overdraft with them; past that, or if the job
+        is no longer indexed, it is left alone and False is returned.
+        """
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None:
+                return False
+            submitter, cost = entry
+            if self._deficit[submitter] <= -self._quantum(submitter):
+                return False
+            if not self._queues[submitter].remove(job_id):
+                return False
+            del self._jobs[job_id]
+            self._deficit[submitter] -= cost
+            self._charged[job_id] = entry
+        return True
+
+    def peek_rank(self, profile, penalty=None):
+        """Return the lowest rank the profile could run, whoever's turn."""
+        with self._lock:
+            queues = list(self._queues.values())
+        ranks = [rank for rank in (
+            queue.peek_rank(profile, penalty) for queue in queues
+        ) if rank is not None]
+        return min(ranks, default=None)
+
+    def depths(self):
+        """Return the number of queued jobs of every submitter seen so far."""
+        with self._lock:
+            return {
+                submitter: len(queue)
+                for submitter, queue in self._queues.items()
+            }
+
+    def _leave(self):
+        """Take the drained ring head out of the ring and reset its deficit."""
+        del self._deficit[self._ring.popleft()]
+        self._granted = False
+
+    def _next_visit(self):
+        """Move the ring on to the next submitter."""
+        self._ring.rotate(-1)
+        self._granted = False
+
+    def _turn(self, skipped):
+        """Return (submitter, queue) to pop from next, or None.
+
+        Walks the ring once from its head, leaving drained submitters
+        behind. If every submitter left that is not in ``skipped`` is
+        overdrawn, grants them all the rounds of quanta the first needs to
+        get back in credit instead of walking the ring that many times.
+        """
+        with self._lock:
+            for _ in range(len(self._ring)):
+                submitter = self._ring[0]
+                if not len(self._queues[submitter]):
+                    self._leave()
+                    continue
+                if submitter not in skipped:
+                    if not self._granted:
+                        self._grant(submitter, 1)
+                        self._granted = True
+                    if self._deficit[submitter] > 0:
+                        return submitter, self._queues[submitter]
+                self._next_visit()
+            waiting = [submitter for submitter in self._ring
+                       if submitter not in skipped]
+            if not waiting:
+                return None
+            rounds = min(
+                math.floor(-self._deficit[submitter]
+                           / self._quantum(submitter)) + 1
+                for submitter in waiting
+            )
+            for submitter in waiting:
+                self._grant(submitter, rounds)
+            while (self._ring[0] in skipped
+                   or self._deficit[self._ring[0]] <= 0):
+                self._next_visit()
+            self._granted = True
+            submitter = self._ring[0]
+            return submitter, self._queues[submitter]
+
+    def _quantum(self, submitter):
+        """Return the credit a submitter gets per visit."""
+        return self.quantum * self.weight(submitter)
+
+    def _grant(self, submitter, rounds):
+        """Add ``rounds`` quanta of credit, capped at one quantum."""
+        quantum = self._quantum(submitter)
+        self._deficit[submitter] = min(
+            self._deficit[submitter] + rounds * quantum, quantum
+        )
+
+    def _charge(self, job_id):
+        """Debit a popped job's cost from its submitter's deficit."""
+        with self._lock:
+            entry = self._jobs.pop(job_id, None)
+            if entry is None:
+                return
+            submitter, cost = self._charged[job_id] = entry
+            if submitter in self._deficit:
+                self._deficit[submitter] -= cost
+
+    def settle(self, job_ids, claimed):
+        """Close the charges of popped job_ids once their claim is done.
+
+        Jobs not in ``claimed`` were never dispatched, so their cost is
+        credited back, up to the one-quantum cap, to submitters still in
+        the ring.
+        """
+        with self._lock:
+            for job_id in job_ids:
+                entry = self._charged.pop(job_id, None)
+                if entry is None or job_id in claimed:
+                    continue
+                submitter, cost = entry
+                if submitter in self._deficit:
+                    self._deficit[submitter] = min(
+                        self._deficit[submitter] + cost,
+                        self._quantum(submitter)
+                    )
+
+    def pop_many(self, profile, limit, capacity=None, penalty=None,
+                 exclude=frozenset()):
+        """Remove and return up to ``limit`` job_ids in fair-share order.
+
+        ``capacity``, ``penalty`` and ``exclude`` are applied as in
+        RequirementIndex.
+        """
+        if penalty is not None:
+            penalty = functools.lru_cache(maxsize=None)(penalty)
+        job_ids = []
+        skipped = set()
+        while len(job_ids) < limit:
+            turn = self._turn(skipped)
+            if turn is None:
+                break
+            submitter, queue = turn
+            popped = queue.pop_many(profile, 1, capacity, penalty, exclude)
+            if not popped:
+                skipped.add(submitter)
+                continue
+            self._charge(popped[0])
+            job_ids.extend(popped)
+        return job_ids
@@ -0,0 +1,43 @@
+"""
+Keeps a worker's scheduler index in step with the other coordinator workers.
+"""
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSync:
+    """Periodically indexes jobs queued through other worker processes.
+
+    Only needed when several coordinator processes share one job store:
+    each keeps its own in-memory index, and this thread replays the
+    storage change feed into it (see Scheduler.sync_index).
+    """
+
+    def __init__(self, scheduler, interval=1):
+        self.scheduler = scheduler
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="nexapod-index-sync", daemon=True
+        )
+
+    def start(self):
+        """Start syncing in a daemon thread."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop syncing and wait for the current pass to finish."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        """Sync every ``interval`` seconds until stopped."""
+        while not self._stop.wait(self.interval):
+            try:
+                self.scheduler.sync_index()
+            except Exception:
+                logger.exception("Index sync failed")
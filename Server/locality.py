@@ -0,0 +1,93 @@
+"""
+Data locality: steer jobs to nodes that already cache their inputs.
+"""
+import hashlib
+import itertools
+import threading
+from Server.placement import class_flops, size_class
+
+
+# Hex characters kept of each digest; 64 bits make collisions between a
+# node's few hundred cached items and the queued inputs negligible.
+DIGEST_CHARS = 16
+
+
+def cache_digest(reference):
+    """Return the digest nodes report for a cached input URI or image.
+
+    Client.cache computes the same digest; the two must stay in sync.
+    """
+    return hashlib.sha256(reference.encode()).hexdigest()[:DIGEST_CHARS]
+
+
+def parse_cached(value, limit):
+    """Return the set of digests from a comma-separated poll parameter.
+
+    At most ``limit`` digests are kept, bounding the work of one claim.
+    """
+    if not value:
+        return frozenset()
+    return frozenset(itertools.islice(
+        (digest for digest in value.split(",") if digest), limit
+    ))
+
+
+class LocalityIndex:
+    """Indexed pending jobs grouped by the digest of their input_uri.
+
+    Lets a claim find the jobs whose input a node reports as cached
+    without scanning the queue. The scheduler keeps it next to its
+    requirement index: jobs are added with it and discarded from it once
+    claimed either way.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # input digest -> {job_id: (rank, requirements, size class FLOPs,
+        # image digest)}
+        self._by_input = {}
+        self._input_of = {}
+
+    def __len__(self):
+        return len(self._input_of)
+
+    def add(self, job_id, job, rank):
+        """Record a pending job that has an input_uri."""
+        uri = job.get("input_uri")
+        if not uri:
+            return
+        digest = cache_digest(uri)
+        image = job.get("docker_image")
+        entry = (rank, job.get("requirements") or {},
+                 class_flops(size_class(job)),
+                 cache_digest(image) if image else None)
+        with self._lock:
+            self._by_input.setdefault(digest, {})[job_id] = entry
+            self._input_of[job_id] = digest
+
+    def discard(self, job_ids):
+        """Forget jobs that were claimed or left the queue."""
+        with self._lock:
+            for job_id in job_ids:
+                digest = self._input_of.pop(job_id, None)
+                if digest is None:
+                    continue
+                jobs = self._by_input[digest]
+                del jobs[job_id]
+                if not jobs:
+                    del self._by_input[digest]
+
+    def candidates(self, cached, scan):
+        """Return (job_id, rank, requirements, class FLOPs) of local jobs.
+
+        At most ``scan`` jobs are looked at per digest, oldest first.
+        Jobs whose image is cached too come first, then by dispatch rank.
+        """
+        found = []
+        with self._lock:
+            for digest in cached:
+                jobs = self._by_input.get(digest)
+                if jobs:
+                    found.extend(itertools.islice(jobs.items(), scan))
+        found.sort(key=lambda item: (item[1][3] not in cached, item[1][0]))
+        return [(job_id, *entry[:3]) for job_id, entry in found]
@@ -0,0 +1,385 @@
+"""
+In-memory capability index used by the scheduler to match jobs to nodes.
+"""
+import functools
+import heapq
+import json
+import random
+import threading
+from Server.placement import class_flops, size_class
+
+
+# Requirement keys that are stored in typed columns next to the JSON
+# payload (req_<key> on jobs, cap_<key> on nodes) so eligibility can be
+# filtered in SQL. Numeric ones are minimums; os must match exactly.
+STRUCTURED_REQUIREMENTS = {
+    "ram_gb": "REAL",
+    "cores": "INTEGER",
+    "threads": "INTEGER",
+    "os": "TEXT",
+    "gpu_count": "INTEGER",
+    "gpu_mem_gb": "REAL",
+    "tier": "INTEGER",
+}
+
+
+def node_capabilities(profile):
+    """Return the profile's values for the STRUCTURED_REQUIREMENTS keys.
+
+    ``gpu_count`` and ``gpu_mem_gb`` (memory of the largest GPU) are
+    derived from the ``gpu`` list reported by Client.profiles unless the
+    profile states them directly. Keys the profile lacks are left out.
+    """
+    capabilities = {
+        key: profile[key] for key in STRUCTURED_REQUIREMENTS
+        if profile.get(key) is not None
+    }
+    gpus = profile.get("gpu")
+    if isinstance(gpus, list):
+        capabilities.setdefault("gpu_count", len(gpus))
+        capabilities.setdefault("gpu_mem_gb", max(
+            (gpu.get("memory_gb", 0) for gpu in gpus
+             if isinstance(gpu, dict)),
+            default=0
+        ))
+    return capabilities
+
+
+def requirement_columns(requirements):
+    """Split requirements into typed column values and an ``extra`` flag.
+
+    Missing numeric requirements become 0 and a missing os None, so the
+    SQL filter needs no NULL handling. ``extra`` is true when some
+    requirement cannot be checked from the columns alone (an unknown key
+    or an unexpected type) and must be rechecked against the profile.
+    """
+    values = {
+        key: None if decl == "TEXT" else 0
+        for key, decl in STRUCTURED_REQUIREMENTS.items()
+    }
+    extra = False
+    for key, value in (requirements or {}).items():
+        decl = STRUCTURED_REQUIREMENTS.get(key)
+        numeric = isinstance(value, (int, float)) and not isinstance(
+            value, bool
+        )
+        if decl == "TEXT" and isinstance(value, str):
+            values[key] = value
+        elif decl in ("REAL", "INTEGER") and numeric:
+            values[key] = value
+        else:
+            extra = True
+    return values, extra
+
+
+# Resources that concurrent jobs on one node share. A job without a
+# ``cores`` requirement still occupies one core.
+PACKED_RESOURCES = ("cores", "ram_gb", "gpu_mem_gb")
+
+
+def packed_demand(values):
+    """Return a job's PACKED_RESOURCES demand from its requirement values."""
+    demand = {key: values.get(key) or 0 for key in PACKED_RESOURCES}
+    demand["cores"] = max(demand["cores"], 1)
+    return demand
+
+
+def resource_demand(requirements):
+    """Return the PACKED_RESOURCES a job with these requirements occupies."""
+    values, _ = requirement_columns(requirements)
+    return packed_demand(values)
+
+
+def node_capacity(profile):
+    """Return the total PACKED_RESOURCES of a node.
+
+    GPU memory is summed over the ``gpu`` list. A profile that does not
+    report cores counts as one core, i.e. one job at a time; RAM that is
+    not reported is not packed on.
+    """
+    capabilities = node_capabilities(profile)
+    capacity = {"cores": capabilities.get("cores") or 1}
+    if "ram_gb" in capabilities:
+        capacity["ram_gb"] = capabilities["ram_gb"]
+    gpus = profile.get("gpu")
+    if isinstance(gpus, list):
+        capacity["gpu_mem_gb"] = sum(
+            gpu.get("memory_gb", 0) for gpu in gpus if isinstance(gpu, dict)
+        )
+    else:
+        capacity["gpu_mem_gb"] = (capabilities.get("gpu_mem_gb", 0)
+                                  * capabilities.get("gpu_count", 1))
+    return capacity
+
+
+def free_capacity(profile, committed):
+    """Return the node's capacity minus the demand of its leased jobs."""
+    capacity = node_capacity(profile)
+    for demand in committed:
+        consume(capacity, demand)
+    return capacity
+
+
+def fits(demand, capacity):
+    """Check whether a job's demand fits in the remaining capacity."""
+    return all(demand[key] <= free for key, free in capacity.items())
+
+
+def consume(capacity, demand):
+    """Subtract a job's demand from the remaining capacity in place."""
+    for key in capacity:
+        capacity[key] -= demand[key]
+
+
+def meets_requirements(profile, requirements):
+    """Check if node profile satisfies job requirements.
+
+    Numeric requirements are minimums; anything else must match exactly.
+    GPU requirements are checked against the derived node_capabilities.
+    """
+    profile = {**profile, **node_capabilities(profile)}
+    for key, value in requirements.items():
+        if key not in profile:
+            return False
+        node_val = profile[key]
+        if isinstance(value, (int, float)):
+            if node_val < value:
+                return False
+        else:
+            if value != node_val:
+                return False
+    return True
+
+
+def signature(mapping):
+    """Return a hashable, order-independent key for a requirements dict."""
+    return json.dumps(mapping or {}, sort_keys=True)
+
+
+class RequirementIndex:
+    """Pending jobs bucketed by requirement signature and size class.
+
+    Jobs with identical requirements share a bucket, so eligibility is
+    checked once per bucket instead of once per job. The list of buckets a
+    given node profile can draw from is cached and only extended when a new
+    signature appears, which keeps lookups independent of queue length.
+
+    Each bucket is a heap ordered by dispatch rank (see Server.priority), so
+    a claim costs one heap pop per eligible bucket head. Removed jobs are
+    dropped lazily when they surface at the head of their heap. Because a
+    bucket also shares a size class (see Server.placement), a per-node
+    penalty on big jobs can be applied to whole buckets at once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._requirements = {}
+        self._demand = {}
+        self._flops = {}
+        self._job_bucket = {}
+        self._eligible = {}
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._job_bucket)
+
+    def add(self, job_id, job, rank):
+        """Index a pending job; returns False if it was already indexed."""
+        requirements = job.get("requirements") or {}
+        size = size_class(job)
+        key = f"{signature(requirements)}#{size}"
+        with self._lock:
+            if job_id in self._job_bucket:
+                return False
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = []
+                self._requirements[key] = requirements
+                self._demand[key] = resource_demand(requirements)
+                self._flops[key] = class_flops(size)
+                for profile_key, eligible in self._eligible.items():
+                    if meets_requirements(json.loads(profile_key),
+                                          requirements):
+                        eligible.append(key)
+            self._seq += 1
+            heapq.heappush(bucket, (rank, self._seq, job_id))
+            self._job_bucket[job_id] = (key, self._seq)
+        return True
+
+    def remove(self, job_id):
+        """Drop a job from the index; returns False if it was not indexed."""
+        with self._lock:
+            return self._job_bucket.pop(job_id, None) is not None
+
+    def _head(self, key):
+        """Return the live entry at the top of a bucket's heap, or None."""
+        bucket = self._buckets[key]
+        while bucket:
+            _, seq, job_id = bucket[0]
+            if self._job_bucket.get(job_id) == (key, seq):
+                return bucket[0]
+            heapq.heappop(bucket)
+        return None
+
+    def pop(self, profile):
+        """Remove and return the lowest-ranked job_id this profile can run.
+
+        The job is taken out of the index before it is claimed in the
+        database, so concurrent callers never race for the same entry.
+        Returns None when nothing eligible is queued.
+        """
+        job_ids = self.pop_many(profile, 1)
+        return job_ids[0] if job_ids else None
+
+    def _eligible_keys(self, profile):
+        """Return the cached bucket keys the profile may draw from."""
+        profile_key = signature(profile)
+        eligible = self._eligible.get(profile_key)
+        if eligible is None:
+            eligible = self._eligible[profile_key] = [
+                key for key, requirements in self._requirements.items()
+                if meets_requirements(profile, requirements)
+            ]
+        return eligible
+
+    def _best(self, eligible, penalties):
+        """Return (bucket key, head entry) of the lowest-ranked live head.
+
+        ``penalties`` maps bucket keys to seconds added to their rank; the
+        returned entry carries the adjusted rank.
+        """
+        best_key, best = None, None
+        for key in eligible:
+            head = self._head(key)
+            if head is None:
+                continue
+            if penalties:
+                head = (head[0] + penalties[key],) + head[1:]
+            if best is None or head < best:
+                best_key, best = key, head
+        return best_key, best
+
+    def _penalties(self, eligible, penalty):
+        """Evaluate penalty(class FLOPs) once per eligible bucket."""
+        if penalty is None:
+            return None
+        return {key: penalty(self._flops[key]) for key in eligible}
+
+    def peek_rank(self, profile, penalty=None):
+        """Return the (penalized) rank of the job pop would return, or None."""
+        with self._lock:
+            eligible = self._eligible_keys(profile)
+            _, best = self._best(eligible, self._penalties(eligible, penalty))
+        return best[0] if best is not None else None
+
+    def pop_many(self, profile, limit, capacity=None, penalty=None,
+                 exclude=frozenset()):
+        """Remove and return up to ``limit`` job_ids in rank order.
+
+        With ``capacity`` (free PACKED_RESOURCES, see free_capacity) only
+        jobs that still fit are taken, and each one's demand is subtracted
+        from the dict, so the jobs returned fit on the node together.
+        ``penalty`` maps a size class's FLOPs to seconds added to the rank
+        of its jobs for this node (see Server.placement). Jobs in
+        ``exclude`` are passed over and stay indexed.
+        """
+        job_ids = []
+        skipped = []
+        with self._lock:
+            eligible = self._eligible_keys(profile)
+            penalties = self._penalties(eligible, penalty)
+            while len(job_ids) < limit:
+                if capacity is not None:
+                    eligible = [key for key in eligible if self._buckets[key]
+                                and fits(self._demand[key], capacity)]
+                best_key, best = self._best(eligible, penalties)
+                if best is None:
+                    break
+                entry = heapq.heappop(self._buckets[best_key])
+                if best[2] in exclude:
+                    skipped.append((best_key, entry))
+                    continue
+                if capacity is not None:
+                    consume(capacity, self._demand[best_key])
+                del self._job_bucket[best[2]]
+                job_ids.append(best[2])
+            for key, entry in skipped:
+                heapq.heappush(self._buckets[key], entry)
+        return job_ids
+
+
+class ShardedRequirementIndex:
+    """RequirementIndex split into independent shards by job_id hash.
+
+    Each shard has its own lock, so concurrent claims for different nodes
+    mostly touch different shards instead of queueing on one lock. A
+    claim visits the shards in random order, starting with the better of
+    two random shard heads; ranks are therefore honoured within a shard
+    and approximately across shards, and no shard is starved.
+    """
+
+    def __init__(self, shards=8):
+        self._shards = [RequirementIndex() for _ in range(max(shards, 1))]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def _shard(self, job_id):
+        """Return the shard that owns job_id."""
+        return self._shards[hash(job_id) % len(self._shards)]
+
+    def add(self, job_id, job, rank):
+        """Index a pending job in its shard, as RequirementIndex.add."""
+        return self._shard(job_id).add(job_id, job, rank)
+
+    def remove(self, job_id):
+        """Drop a job from its shard; returns False if it was not indexed."""
+        return self._shard(job_id).remove(job_id)
+
+    def take(self, job_id):
+        """Remove a job chosen outside pop_many, e.g. for data locality.
+
+        Returns False if it is no longer indexed.
+        """
+        return self.remove(job_id)
+
+    def pop(self, profile):
+        """Remove and return one job_id this profile can run, or None."""
+        job_ids = self.pop_many(profile, 1)
+        return job_ids[0] if job_ids else None
+
+    def peek_rank(self, profile, penalty=None):
+        """Return the lowest (penalized) rank over all shards, or None."""
+        ranks = [rank for rank in (
+            shard.peek_rank(profile, penalty) for shard in self._shards
+        ) if rank is not None]
+        return min(ranks, default=None)
+
+    def pop_many(self, profile, limit, capacity=None, penalty=None,
+                 exclude=frozenset()):
+        """Remove and return up to ``limit`` job_ids, trying shards in turn.
+
+        ``capacity``, ``penalty`` and ``exclude`` are applied as in
+        RequirementIndex.
+        """
+        if penalty is not None:
+            # Shards share size classes; evaluate each class once per call.
+            penalty = functools.lru_cache(maxsize=None)(penalty)
+        order = random.sample(self._shards, len(self._shards))
+        if len(order) > 1:
+            first, second = (
+                shard.peek_rank(profile, penalty) for shard in order[:2]
+            )
+            if second is not None and (first is None or second < first):
+                order[0], order[1] = order[1], order[0]
+        job_ids = []
+        for shard in order:
+            job_ids.extend(
+                shard.pop_many(
+                    profile, limit - len(job_ids), capacity, penalty, exclude
+                )
+            )
+            if len(job_ids) == limit:
+                break
+        return job_ids
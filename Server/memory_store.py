@@ -0,0 +1,622 @@
+"""
+In-memory storage backend for benchmarks, tests and disposable clusters.
+"""
+import heapq
+import os
+from collections import deque
+import threading
+import time
+from Server.db import JOB_FIELDS, NODE_FIELDS
+from Server.matcher import (
+    consume, fits, free_capacity, meets_requirements, resource_demand,
+)
+from Server.placement import node_owner, updated_estimate
+from Infrastructure.perf_estimator import estimate_flops
+
+
+class MemoryStorage:
+    """Implements Server.storage.Storage without touching the disk.
+
+    Jobs are spread over ``memory_stripes`` dicts by job_id hash, each
+    guarded by its own lock, so claims and votes on different jobs rarely
+    contend. Nodes, per-node committed resources and the change feed have
+    one lock each; a stripe lock may be held while taking one of those,
+    never the other way round.
+
+    Job and profile dicts are stored as given and returned without
+    copying, so callers must not mutate them. Nothing survives a restart.
+    """
+
+    def __init__(self, config, clock=time.time):
+        # Seconds since the epoch; the scheduler simulator passes its own.
+        self.clock = clock
+        self.lease_seconds = config.get("lease_seconds", 300)
+        self.bin_packing = config.get("bin_packing", True)
+        self.perf_alpha = config.get("perf_ewma_alpha", 0.2)
+        self.replicas = config.get("quorum", 1)
+        self.runtime_window = config.get("speculation", {}).get(
+            "runtime_window", 1000
+        )
+        stripes = config.get("memory_stripes", 16)
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._jobs = [{} for _ in range(stripes)]
+        self._nodes = {}
+        self._nodes_lock = threading.Lock()
+        # node_id -> {job_id: packed demand} for every job leased to it.
+        self._committed = {}
+        self._committed_lock = threading.Lock()
+        # node_id and owner -> ids of jobs they took a replica slot of.
+        # Entries whose slot is gone are only dropped by get_held.
+        self._held = {}
+        self._held_lock = threading.Lock()
+        # node_id -> measured FLOPs/s, as in the node_perf table, and job
+        # type -> recent runtimes, as in runtime_samples.
+        self._node_flops = {}
+        self._runtimes = {}
+        self._perf_lock = threading.Lock()
+        self._changes = []
+        self._first_seq = 1
+        self._changes_lock = threading.Lock()
+
+    def _stripe(self, job_id):
+        """Return the index of the stripe holding job_id."""
+        return hash(job_id) % len(self._locks)
+
+    def _by_stripe(self, job_ids):
+        """Group job_ids by stripe, keeping their relative order."""
+        groups = {}
+        for job_id in job_ids:
+            groups.setdefault(self._stripe(job_id), []).append(job_id)
+        return groups.items()
+
+    def _log_change(self, kind, entity_id, status, assigned_node=None,
+                    data=None):
+        """Append an entry to the change feed."""
+        with self._changes_lock:
+            self._changes.append({
+                "seq": self._first_seq + len(self._changes),
+                "kind": kind,
+                "id": entity_id,
+                "status": status,
+                "assigned_node": assigned_node,
+                "data": data,
+            })
+
+    def _set_status(self, record, status, assigned_node):
+        """Move a job record to a new state and log the transition."""
+        record["status"] = status
+        record["assigned_node"] = assigned_node
+        self._log_change("job", record["job_id"], status, assigned_node)
+
+    def register_node(self, profile):
+        """Register a new node profile and return its generated node_id."""
+        node_id = os.urandom(8).hex()
+        with self._nodes_lock:
+            self._nodes[node_id] = profile
+            self._log_change("node", node_id, "registered", data=profile)
+        return node_id
+
+    def get_node_profile(self, node_id):
+        """Retrieve stored node profile for a given node_id."""
+        return self._nodes.get(node_id)
+
+    def list_nodes(self, after=None, limit=1000, fields=None):
+        """Return one page of nodes ordered by node_id."""
+        with self._nodes_lock:
+            rows = [
+                {"node_id": node_id, "profile": profile}
+                for node_id, profile in self._nodes.items()
+            ]
+        return self._page(rows, "node_id", fields or NODE_FIELDS,
+                          NODE_FIELDS, after, limit)
+
+    def add_job(self, job, rank=None):
+        """Insert a new job with pending status; duplicates raise ValueError."""
+        if not self.add_jobs([job], None if rank is None else [rank]):
+            raise ValueError(f"Job {job['job_id']} already exists")
+
+    def add_jobs(self, jobs, ranks=None):
+        """Insert many pending jobs, skipping known job_ids.
+
+        Returns the number of jobs actually inserted.
+        """
+        submitted_at = self.clock()
+        if ranks is None:
+            ranks = [submitted_at] * len(jobs)
+        inserted = 0
+        for job, rank in zip(jobs, ranks):
+            job_id = job["job_id"]
+            i = self._stripe(job_id)
+            with self._locks[i]:
+                existing = self._jobs[i].get(job_id)
+                if existing is not None and "job" in existing:
+                    continue
+                record = self._jobs[i][job_id] = {
+                    "job_id": job_id,
+                    "job": job,
+                    "assigned_node": None,
+                    "status": "pending",
+                    "submitter": job.get("submitter"),
+                    "submitted_at": submitted_at,
+                    "dispatch_rank": rank,
+                    "finished_at": None,
+                    "demand": resource_demand(job.get("requirements")),
+                    "est_flops": estimate_flops(job),
+                    "leased_at": {},
+                    "archived": False,
+                    "leases": {},
+                    "votes": {},
+                    "result": None,
+                    "replicas": self.replicas,
+                    "speculated": 0,
+                    # node_id -> {"owner", "delivered"}, as replica_slots.
+                    "slots": {},
+                }
+                if existing is not None:
+                    # Votes that arrived before the job was submitted.
+                    record["votes"] = existing["votes"]
+                    record["slots"] = existing["slots"]
+                self._log_change("job", job_id, "pending")
+            inserted += 1
+        return inserted
+
+    def iter_pending_jobs(self, page_size=256):
+        """Yield (job_id, job dict, dispatch rank) for pending jobs."""
+        for lock, jobs in zip(self._locks, self._jobs):
+            with lock:
+                pending = [
+                    (job_id, record["job"], record["dispatch_rank"])
+                    for job_id, record in jobs.items()
+                    if record["status"] == "pending"
+                ]
+            yield from pending
+
+    def get_pending(self, job_ids):
+        """Return (job_id, job dict, dispatch rank) for ids still pending."""
+        pending = []
+        for i, ids in self._by_stripe(job_ids):
+            with self._locks[i]:
+                for job_id in ids:
+                    record = self._jobs[i].get(job_id)
+                    if record is not None and record["status"] == "pending":
+                        pending.append(
+                            (job_id, record["job"], record["dispatch_rank"])
+                        )
+        return pending
+
+    def get_committed(self, node_id):
+        """Return the demand of the node's leased jobs, for free_capacity."""
+        with self._committed_lock:
+            return list(self._committed.get(node_id, {}).values())
+
+    def get_held(self, node_id):
+        """Return the pending jobs whose slot the node or its owner holds."""
+        owner = node_owner(self._nodes.get(node_id) or {})
+        keys = [key for key in (("node", node_id), ("owner", owner))
+                if key[1] is not None]
+        with self._held_lock:
+            candidates = set().union(
+                *(self._held.get(key, ()) for key in keys)
+            )
+        held, stale = set(), set()
+        for i, ids in self._by_stripe(candidates):
+            with self._locks[i]:
+                for job_id in ids:
+                    record = self._jobs[i].get(job_id)
+                    if record is None or self._slot_open(
+                        record, node_id, owner
+                    ):
+                        stale.add(job_id)
+                    elif record["status"] == "pending":
+                        held.add(job_id)
+        if stale:
+            with self._held_lock:
+                for key in keys:
+                    self._held.get(key, set()).difference_update(stale)
+        return held
+
+    def _reserve(self, job_ids, node_id, limit=None):
+        """Commit node capacity to the job_ids that fit; returns those ids.
+
+        At most ``limit`` jobs are reserved when it is given.
+        Capacity is reserved before the jobs are claimed so two concurrent
+        claims for one node cannot both use the same free cores; claims
+        that then fail give their reservation back through _release.
+        """
+        profile = self._nodes.get(node_id)
+        with self._committed_lock:
+            committed = self._committed.setdefault(node_id, {})
+            capacity = None
+            if self.bin_packing and profile is not None:
+                capacity = free_capacity(profile, committed.values())
+            reserved = []
+            for job_id in job_ids:
+                if len(reserved) == limit:
+                    break
+                record = self._jobs[self._stripe(job_id)].get(job_id)
+                if record is None or "demand" not in record:
+                    continue
+                if capacity is not None:
+                    if not fits(record["demand"], capacity):
+                        continue
+                    consume(capacity, record["demand"])
+                committed[job_id] = record["demand"]
+                reserved.append(job_id)
+        return reserved
+
+    def _release(self, job_id, node_ids):
+        """Return the capacity the job held on each of the nodes."""
+        with self._committed_lock:
+            for node_id in node_ids:
+                self._committed.get(node_id, {}).pop(job_id, None)
+
+    def _drop_leases(self, record, node_ids):
+        """Remove the nodes' leases on a job and release their capacity."""
+        node_ids = [node_id for node_id in node_ids
+                    if record["leases"].pop(node_id, None) is not None]
+        self._release(record["job_id"], node_ids)
+
+    def claim_jobs(self, job_ids, node_id, limit=None):
+        """Claim a replica slot of every still-pending job in job_ids.
+
+        Jobs whose replica the node or its owner already holds are left
+        out, as are, with bin_packing, jobs that would overcommit the node.
+        ``limit`` caps how many of the fitting jobs are claimed.
+        """
+        now = self.clock()
+        expires_at = now + self.lease_seconds
+        owner = node_owner(self._nodes.get(node_id) or {})
+        claimed = []
+        reserved = self._reserve(job_ids, node_id, limit)
+        for i, ids in self._by_stripe(reserved):
+            with self._locks[i]:
+                for job_id in ids:
+                    record = self._jobs[i].get(job_id)
+                    if record is None or record["status"] != "pending" or (
+                        not self._slot_open(record, node_id, owner)
+                    ):
+                        self._release(job_id, [node_id])
+                        continue
+                    slots = record["slots"]
+                    slots[node_id] = {"owner": owner, "delivered": False}
+                    self._hold(job_id, node_id, owner)
+                    self._set_status(
+                        record,
+                        "assigned" if len(slots) >= record["replicas"]
+                        else "pending",
+                        node_id
+                    )
+                    record["leases"][node_id] = expires_at
+                    record["leased_at"][node_id] = now
+                    claimed.append(record["job"])
+        return claimed
+
+    def _hold(self, job_id, node_id, owner):
+        """Note that the node, and its owner, took a slot of the job."""
+        with self._held_lock:
+            self._held.setdefault(("node", node_id), set()).add(job_id)
+            if owner is not None:
+                self._held.setdefault(("owner", owner), set()).add(job_id)
+
+    @staticmethod
+    def _slot_open(record, node_id, owner):
+        """Return whether the node may take a replica slot of the job."""
+        slots = record["slots"]
+        return node_id not in slots and (owner is None or all(
+            slot["owner"] != owner for slot in slots.values()
+        ))
+
+    def claim_matching(self, node_id, limit):
+        """Claim up to ``limit`` pending jobs the node can run, in rank order.
+
+        Scans every stripe; the scheduler's index is the fast path and this
+        is only used when it is disabled.
+        """
+        profile = self.get_node_profile(node_id)
+        if profile is None:
+            return []
+        owner = node_owner(profile)
+        candidates = []
+        for lock, jobs in zip(self._locks, self._jobs):
+            with lock:
+                candidates.extend(
+                    (record["dispatch_rank"], job_id)
+                    for job_id, record in jobs.items()
+                    if record["status"] == "pending"
+                    and self._slot_open(record, node_id, owner)
+                    and meets_requirements(
+                        profile, record["job"].get("requirements") or {}
+                    )
+                )
+        chosen = [job_id for _, job_id in sorted(candidates)]
+        return self.claim_jobs(chosen, node_id, limit)
+
+    def renew_leases(self, node_id, job_ids=None):
+        """Extend the node's leases and return the job_ids still held."""
+        expires_at = self.clock() + self.lease_seconds
+        renewed = []
+        if job_ids is None:
+            stripes = [(i, None) for i in range(len(self._locks))]
+        else:
+            stripes = self._by_stripe(job_ids)
+        for i, ids in stripes:
+            with self._locks[i]:
+                jobs = self._jobs[i]
+                for job_id in jobs if ids is None else ids:
+                    record = jobs.get(job_id)
+                    if record is not None and node_id in record["leases"]:
+                        record["leases"][node_id] = expires_at
+                        renewed.append(job_id)
+        return renewed
+
+    def reclaim_expired_leases(self, now=None, limit=1000):
+        """Drop up to ``limit`` expired leases and requeue their jobs.
+
+        Returns (job_id, job dict, dispatch rank) for every job that has an
+        open replica slot again, as for DB.reclaim_expired_leases.
+        """
+        now = self.clock() if now is None else now
+        dropped, requeued = 0, []
+        for lock, jobs in zip(self._locks, self._jobs):
+            with lock:
+                for record in jobs.values():
+                    if dropped >= limit:
+                        return requeued
+                    leases = record["leases"]
+                    expired = [node_id for node_id, expires_at
+                               in leases.items() if expires_at < now]
+                    if not expired:
+                        continue
+                    self._drop_leases(record, expired)
+                    dropped += len(expired)
+                    slots = record["slots"]
+                    for node_id in expired:
+                        slot = slots.get(node_id)
+                        if slot is not None and not slot["delivered"]:
+                            del slots[node_id]
+                    if (record["status"] in ("pending", "assigned")
+                            and len(slots) < record["replicas"]):
+                        self._set_status(record, "pending", None)
+                        requeued.append((record["job_id"], record["job"],
+                                         record["dispatch_rank"]))
+        return requeued
+
+    def record_votes(self, results, quorum):
+        """Record many votes and finalize every job that reaches quorum.
+
+        Returns one outcome per result, as for DB.record_votes. Each vote
+        is applied atomically under its job's stripe lock, but unlike the
+        SQLite backend the batch as a whole is not one transaction.
+        """
+        outcomes = []
+        for result in results:
+            try:
+                outcomes.append(self._record_vote(result, quorum))
+            except (KeyError, TypeError) as e:
+                outcomes.append({
+                    "job_id": result.get("job_id"),
+                    "status": "rejected",
+                    "error": f"Could not record vote: {e!r}",
+                })
+        return outcomes
+
+    def _record_vote(self, result, quorum):
+        """Insert one vote and finalize its job if that reaches quorum."""
+        job_id, sha256 = result["job_id"], result["sha256"]
+        node_id = result.get("node_id", "")
+        i = self._stripe(job_id)
+        with self._locks[i]:
+            record = self._jobs[i].get(job_id)
+            if record is None:
+                # Votes for unknown jobs are kept, as in the SQLite backend.
+                record = self._jobs[i][job_id] = {
+                    "job_id": job_id, "status": None, "archived": False,
+                    "leases": {}, "votes": {}, "result": None, "slots": {},
+                }
+            if record["archived"]:
+                return {"job_id": job_id, "status": "already finalized",
+                        "votes": None}
+            voters = record["votes"].setdefault(sha256, {})
+            leased = node_id in record["leases"]
+            self._drop_leases(record, [node_id])
+            if node_id in voters:
+                return {"job_id": job_id, "status": "duplicate vote",
+                        "votes": len(voters)}
+            voters[node_id] = result
+            if leased:
+                self._observe_throughput(record, node_id)
+            slots = record["slots"]
+            if node_id in slots:
+                slots[node_id]["delivered"] = True
+            if "job" not in record or record["status"] == "completed":
+                return {"job_id": job_id, "status": "vote recorded",
+                        "votes": len(voters), "reopened": False}
+            if len(voters) >= quorum:
+                record["result"] = next(iter(voters.values()))
+                record["finished_at"] = self.clock()
+                self._drop_leases(record, list(record["leases"]))
+                slots.clear()
+                self._set_status(record, "completed", record["assigned_node"])
+                return {"job_id": job_id, "status": "finalized",
+                        "votes": len(voters),
+                        "completion_seconds": (
+                            record["finished_at"] - record["submitted_at"]
+                        )}
+            # Every replica reported without reaching quorum: open one more
+            # slot so another node can break the tie.
+            delivered = sum(slot["delivered"] for slot in slots.values())
+            reopened = delivered >= record["replicas"]
+            if reopened:
+                record["replicas"] += 1
+                self._set_status(record, "pending", record["assigned_node"])
+            return {"job_id": job_id, "status": "vote recorded",
+                    "votes": len(voters), "reopened": reopened}
+
+    def _observe_throughput(self, record, node_id):
+        """Update the node's FLOPs/s and runtime samples, as the DB does."""
+        leased_at = record["leased_at"].get(node_id)
+        elapsed = self.clock() - leased_at if leased_at else 0
+        if "job" not in record or elapsed <= 0:
+            return
+        job_type = record["job"].get("type") or ""
+        with self._perf_lock:
+            self._runtimes.setdefault(
+                job_type, deque(maxlen=self.runtime_window)
+            ).append(elapsed)
+            if not record["est_flops"]:
+                return
+            self._node_flops[node_id] = updated_estimate(
+                self._node_flops.get(node_id),
+                record["est_flops"] / elapsed, self.perf_alpha
+            )
+
+    def get_runtime_quantile(self, job_type, quantile, min_samples=1):
+        """Return a quantile of the type's recent runtimes, or None."""
+        with self._perf_lock:
+            runtimes = sorted(self._runtimes.get(job_type or "", ()))
+        if not runtimes or len(runtimes) < min_samples:
+            return None
+        return runtimes[round((len(runtimes) - 1) * quantile)]
+
+    def get_running_replicas(self, leased_before, max_speculated, limit=1000):
+        """Return replicas still running, as DB.get_running_replicas."""
+        running = []
+        for lock, jobs in zip(self._locks, self._jobs):
+            with lock:
+                for job_id, record in jobs.items():
+                    if (record["status"] != "assigned"
+                            or record["speculated"] >= max_speculated):
+                        continue
+                    for node_id in record["leases"]:
+                        leased_at = record["leased_at"][node_id]
+                        if leased_at < leased_before:
+                            running.append((
+                                job_id, record["job"].get("type"),
+                                record["est_flops"], leased_at,
+                                self._node_flops.get(node_id),
+                            ))
+        running.sort(key=lambda replica: replica[3])
+        return running[:limit]
+
+    def add_speculative_replicas(self, job_ids, max_speculated):
+        """Open one more replica slot on each of the straggling jobs.
+
+        Returns (job_id, job dict, dispatch rank) for every job that is
+        pending again, as for DB.add_speculative_replicas.
+        """
+        reopened = []
+        for i, ids in self._by_stripe(job_ids):
+            with self._locks[i]:
+                for job_id in ids:
+                    record = self._jobs[i].get(job_id)
+                    if (record is None or record["status"] != "assigned"
+                            or record["speculated"] >= max_speculated):
+                        continue
+                    record["replicas"] += 1
+                    record["speculated"] += 1
+                    self._set_status(record, "pending", record["assigned_node"])
+                    reopened.append(
+                        (job_id, record["job"], record["dispatch_rank"])
+                    )
+        return reopened
+
+    def get_node_flops(self, node_id):
+        """Return the node's measured FLOPs/s, or None if never measured."""
+        return self._node_flops.get(node_id)
+
+    def get_fleet_flops(self, quantile):
+        """Return the given quantile of measured node FLOPs/s, or None."""
+        with self._perf_lock:
+            flops = sorted(self._node_flops.values())
+        if not flops:
+            return None
+        return flops[round((len(flops) - 1) * quantile)]
+
+    def get_job(self, job_id):
+        """Return a job with its final result, or None if unknown."""
+        i = self._stripe(job_id)
+        with self._locks[i]:
+            record = self._jobs[i].get(job_id)
+            if record is None or "job" not in record:
+                return None
+            job = {field: record[field] for field in JOB_FIELDS}
+            job["result"] = record["result"]
+            return job
+
+    def list_jobs(self, after=None, limit=1000, status=None, submitter=None,
+                  fields=None):
+        """Return one page of jobs ordered by job_id, as for DB.list_jobs.
+
+        There is no ordered index, so each page scans every stripe; this
+        backend is meant for listings of modest size.
+        """
+        rows = []
+        for lock, jobs in zip(self._locks, self._jobs):
+            with lock:
+                rows.extend(
+                    record for record in jobs.values()
+                    if "job" in record
+                    and (status is None or record["status"] == status)
+                    and (submitter is None or record["submitter"] == submitter)
+                )
+        return self._page(rows, "job_id", fields or JOB_FIELDS, JOB_FIELDS,
+                          after, limit)
+
+    @staticmethod
+    def _page(rows, key, fields, allowed, after, limit):
+        """Project the first ``limit`` rows with key above ``after``."""
+        unknown = set(fields) - set(allowed)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        fields = [key] + [field for field in fields if field != key]
+        if after is not None:
+            rows = (row for row in rows if row[key] > after)
+        page = heapq.nsmallest(limit, rows, key=lambda row: row[key])
+        return [{field: row[field] for field in fields} for row in page]
+
+    def get_changes(self, since=0, limit=1000):
+        """Return transitions after ``since``, as for DB.get_changes."""
+        with self._changes_lock:
+            start = max(since - self._first_seq + 1, 0)
+            changes = self._changes[start:start + limit]
+            first = self._first_seq if self._changes else None
+            last = self._first_seq + len(self._changes) - 1
+        reset = first is not None and since < first - 1
+        if changes:
+            last = changes[-1]["seq"]
+        elif first is None or since > last:
+            last = since
+        return {"changes": changes, "last_seq": last, "reset": reset}
+
+    def compact_finished(self, before, limit=500):
+        """Archive up to ``limit`` jobs completed before ``before``.
+
+        Archived jobs drop their votes and leases but remain visible to
+        get_job and list_jobs. Returns the number of jobs archived.
+        """
+        archived = 0
+        for lock, jobs in zip(self._locks, self._jobs):
+            with lock:
+                for record in jobs.values():
+                    if archived == limit:
+                        return archived
+                    if (record["status"] == "completed"
+                            and not record["archived"]
+                            and record["finished_at"] < before):
+                        record["archived"] = True
+                        record["votes"] = {}
+                        record["slots"] = {}
+                        self._drop_leases(record, list(record["leases"]))
+                        archived += 1
+        return archived
+
+    def trim_changes(self, keep):
+        """Delete all but the newest ``keep`` change feed entries."""
+        with self._changes_lock:
+            trimmed = max(len(self._changes) - keep, 0)
+            del self._changes[:trimmed]
+            self._first_seq += trimmed
+        return trimmed
+
+    def close(self):
+        """Nothing to release; present for interface parity with DB."""
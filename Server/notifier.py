@@ -0,0 +1,45 @@
+"""
+Wake-ups for long-polling job requests.
+"""
+import asyncio
+
+
+class JobNotifier:
+    """Lets /job requests park until new work may be claimable.
+
+    Waiters share one asyncio.Event per generation; ``notify`` sets it and
+    starts a new generation. It is safe to call from any thread, which is
+    how the scheduler reports submissions and reclaimed leases from the
+    database thread pool. Callers take the current generation *before*
+    trying to claim, so a notification that lands between a failed claim
+    and the wait is not lost.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._event = None
+
+    def generation(self) -> asyncio.Event:
+        """Return the event the next notification will set."""
+        if self._event is None:
+            self._loop = asyncio.get_running_loop()
+            self._event = asyncio.Event()
+        return self._event
+
+    async def wait(self, generation: asyncio.Event, timeout: float) -> bool:
+        """Wait until ``generation`` is notified; False on timeout."""
+        try:
+            await asyncio.wait_for(generation.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def notify(self):
+        """Wake every request currently waiting for work."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        """Set the current generation and start a fresh one."""
+        event, self._event = self._event, asyncio.Event()
+        event.set()
@@ -0,0 +1,47 @@
+"""
+Throughput-aware placement: which pending jobs suit which nodes.
+"""
+import math
+from Infrastructure.perf_estimator import estimate_flops, estimate_time
+
+
+def size_class(job):
+    """Return the job's size class, floor(log2) of its estimated FLOPs.
+
+    Jobs of one class are interchangeable for placement, so the scheduler
+    index keeps them in a shared bucket.
+    """
+    flops = estimate_flops(job)
+    return int(math.log2(flops)) if flops >= 1 else 0
+
+
+def class_flops(size):
+    """Return the representative FLOPs of a size class."""
+    return 2.0 ** size
+
+
+def completion_penalty(flops, node_flops, fast_flops):
+    """Return the seconds a job loses running on this node, not a fast one.
+
+    Zero when the node is at least as fast as the reference.
+    """
+    job = {"estimated_flops": flops}
+    return max(
+        estimate_time(job, node_flops) - estimate_time(job, fast_flops), 0.0
+    )
+
+
+def node_owner(profile):
+    """Return the identity replica anti-affinity groups nodes by.
+
+    Nodes registered with the same key belong to one operator, whose
+    replicas of a job would not be independent votes.
+    """
+    return profile.get("public_key")
+
+
+def updated_estimate(previous, observed, alpha):
+    """Fold one observed FLOPs/s sample into an exponentially weighted mean."""
+    if previous is None:
+        return observed
+    return alpha * observed + (1 - alpha) * previous
@@ -0,0 +1,72 @@
+"""
+Dispatch ordering for pending jobs: priority, deadline slack and aging.
+"""
+from Infrastructure.perf_estimator import estimate_time
+
+
+PRIORITY_LEVELS = {"low": 0, "normal": 1, "high": 2, "urgent": 3}
+
+
+def _field(job, key):
+    """Return a job field given at the top level or under ``metadata``."""
+    if key in job:
+        return job[key]
+    metadata = job.get("metadata")
+    return metadata.get(key) if isinstance(metadata, dict) else None
+
+
+def job_priority(job):
+    """Return the job's priority level as an integer (higher is sooner).
+
+    Accepts the named levels from the protocol's ``metadata.priority`` or a
+    plain integer, either at the top level or under ``metadata``. Anything
+    else counts as normal priority.
+    """
+    value = _field(job, "priority")
+    if value is None:
+        return PRIORITY_LEVELS["normal"]
+    if isinstance(value, str):
+        return PRIORITY_LEVELS.get(value.lower(), PRIORITY_LEVELS["normal"])
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return PRIORITY_LEVELS["normal"]
+
+
+def job_deadline(job):
+    """Return the job's deadline as a UNIX timestamp, or None.
+
+    A deadline that is not a number is ignored.
+    """
+    value = _field(job, "deadline")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def dispatch_rank(job, submitted_at, config):
+    """Return the sort key persisted with a pending job; lowest goes first.
+
+    A waiting job gains one priority level every ``priority_aging_seconds``.
+    All pending jobs age at the same rate, so ordering them by effective
+    priority at any moment is the same as ordering by
+    ``submitted_at - priority * aging``. That key is fixed at submit time
+    and can live in an index, which keeps claims logarithmic while still
+    guaranteeing low-priority work is eventually served.
+
+    Jobs with a deadline are additionally ranked by their latest feasible
+    start (deadline minus the runtime estimated on a
+    ``reference_node_flops`` machine), pulled forward by
+    ``deadline_slack_window`` so they overtake ordinary work before their
+    slack runs out.
+    """
+    aging = config.get("priority_aging_seconds", 300)
+    rank = submitted_at - job_priority(job) * aging
+    deadline = job_deadline(job)
+    if deadline is not None:
+        reference_flops = config.get("reference_node_flops", 1.0e12)
+        latest_start = deadline - estimate_time(job, reference_flops)
+        window = config.get("deadline_slack_window", 3600)
+        rank = min(rank, latest_start - window)
+    return rank
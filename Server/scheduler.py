@@ -3,37 +3,445 @@ Scheduler module for assigning jobs to nodes based on their profile.
 """
 
 import threading
+import time
+from Server.matcher import (
+    ShardedRequirementIndex, consume, fits, free_capacity, meets_requirements,
+    resource_demand,
+)
+from Server.fair_share import FairShareIndex
+from Server.locality import LocalityIndex
+from Server.placement import completion_penalty
+from Server.priority import dispatch_rank
+from Infrastructure.perf_estimator import estimate_time
 
 
 class Scheduler:
-    """Assigns pending jobs to nodes."""
+    """Assigns pending jobs to nodes.
 
-    def __init__(self, db, config):
+    Matching normally runs against a sharded in-memory index. With
+    ``scheduler_index`` set to false the index is not kept and every claim
+    is filtered by the storage backend instead (see DB.claim_matching),
+    which trades claim latency for a smaller, always-current footprint.
+    With ``fair_share`` enabled the index keeps one queue per submitter
+    and claims rotate between them (see Server.fair_share).
+    """
+
+    def __init__(self, db, config, on_available=None, clock=time.time):
         self.db = db
         self.config = config
-        self.lock = threading.Lock()
+        # Seconds since the epoch; the scheduler simulator passes its own.
+        self.clock = clock
+        # Called with no arguments whenever new work becomes claimable.
+        self.on_available = on_available
+        self.use_index = config.get("scheduler_index", True)
+        self.shards = config.get("scheduler_shards", 8)
+        self.bin_packing = config.get("bin_packing", True)
+        self.placement_weight = config.get("placement_weight", 1.0)
+        self.replicas = config.get("quorum", 1)
+        self.max_misses = config.get("max_claim_misses", 64)
+        self.speculation = config.get("speculation", {})
+        self.fair_share = config.get("fair_share", {}).get("enabled", True)
+        self.locality = config.get("locality", {})
+        # job_id -> (job, rank) of speculative copies kept for fast nodes.
+        self._speculative = {}
+        self._speculative_lock = threading.Lock()
+        self._fast_flops = None
+        self._fast_flops_at = float("-inf")
+        self.index = self._new_index()
+        self.local_index = LocalityIndex()
+        self.rebuild_index()
 
-    def assign_job(self, node_id):
-        """Assign the first pending job whose requirements match the node's profile."""
-        with self.lock:
-            profile = self.db.get_node_profile(node_id)
-            for job_id, job in self.db.get_pending_jobs():
-                requirements = job.get("requirements", {})
-                if self._meets_requirements(profile, requirements):
-                    self.db.assign_job_to_node(job_id, node_id)
-                    return job
-            return None
+    def _new_index(self):
+        """Return an empty matching index."""
+        if self.fair_share:
+            return FairShareIndex(self.shards, self.config)
+        return ShardedRequirementIndex(self.shards)
+
+    def queue_depths(self):
+        """Return the indexed pending jobs of each submitter.
+
+        Empty unless ``fair_share`` queues jobs per submitter.
+        """
+        if not (self.use_index and self.fair_share):
+            return {}
+        return self.index.depths()
 
-    def _meets_requirements(self, profile, requirements):
-        """Check if node profile satisfies job requirements."""
-        for key, value in requirements.items():
-            if key not in profile:
-                return False
-            node_val = profile[key]
-            if isinstance(value, (int, float)):
-                if node_val < value:
-                    return False
-            else:
-                if value != node_val:
-                    return False
+    def _available(self):
+        """Tell the on_available listener that jobs were queued."""
+        if self.on_available is not None:
+            self.on_available()
+
+    def rebuild_index(self):
+        """Load every pending job from the database into the matching index."""
+        self.index = self._new_index()
+        self.local_index = LocalityIndex()
+        if not self.use_index:
+            return
+        # Changes after this point are replayed by sync_index.
+        self._synced_seq = self.db.get_changes(0, 0)["last_seq"]
+        for job_id, job, rank in self.db.iter_pending_jobs():
+            self._index(job_id, job, rank)
+
+    def _index(self, job_id, job, rank):
+        """Add a pending job to the matching and locality indexes.
+
+        Returns False if it was already indexed.
+        """
+        if not self.index.add(job_id, job, rank):
+            return False
+        if self.locality.get("enabled", True):
+            self.local_index.add(job_id, job, rank)
         return True
+
+    def submit_job(self, job):
+        """Persist a new job and make it available for matching."""
+        rank = dispatch_rank(job, self.clock(), self.config)
+        self.db.add_job(job, rank)
+        if self.use_index:
+            self._index(job["job_id"], job, rank)
+        self._available()
+
+    def submit_jobs(self, jobs):
+        """Persist a batch of jobs and index them; returns rows inserted."""
+        now = self.clock()
+        ranks = [dispatch_rank(job, now, self.config) for job in jobs]
+        inserted = self.db.add_jobs(jobs, ranks)
+        if self.use_index:
+            for job, rank in zip(jobs, ranks):
+                self._index(job["job_id"], job, rank)
+        if inserted:
+            self._available()
+        return inserted
+
+    def fast_flops(self):
+        """Return the fleet's fast-node throughput, refreshed periodically.
+
+        This is the ``placement_fast_quantile`` of measured node FLOPs/s,
+        the speed a job could expect if it waited for a fast node.
+        """
+        now = self.clock()
+        if now - self._fast_flops_at >= self.config.get(
+            "placement_refresh_seconds", 60
+        ):
+            self._fast_flops = self.db.get_fleet_flops(
+                self.config.get("placement_fast_quantile", 0.9)
+            )
+            self._fast_flops_at = now
+        return self._fast_flops
+
+    def placement_penalty(self, node_id):
+        """Return the rank penalty for jobs placed on this node, or None.
+
+        A node slower than the fleet's fast nodes sees each job's rank
+        pushed back by the extra seconds it would take to run there, times
+        ``placement_weight``. Small jobs barely move, large ones wait for a
+        fast node unless they have aged enough to outrank that delay.
+        Unmeasured nodes and a fleet without measurements get no penalty.
+        """
+        if not self.placement_weight:
+            return None
+        node_flops = self.db.get_node_flops(node_id)
+        fast = self.fast_flops()
+        if not node_flops or not fast or node_flops >= fast:
+            return None
+        weight = self.placement_weight
+        return lambda flops: weight * completion_penalty(
+            flops, node_flops, fast
+        )
+
+    def assign_job(self, node_id):
+        """Assign the most urgent pending job the node's profile can run.
+
+        Candidates come from the requirement index, and each one is claimed
+        through the database's conditional update. A candidate that another
+        coordinator process already took (or that was a duplicate of a
+        finished job) fails the claim and is simply dropped from the index.
+        """
+        jobs = self.assign_jobs(node_id, 1)
+        return jobs[0] if jobs else None
+
+    def assign_jobs(self, node_id, limit, cached=frozenset()):
+        """Lease up to ``limit`` matching jobs to the node.
+
+        Each round pops candidates from the index and claims a replica slot
+        of all of them in one database transaction; rounds repeat only to
+        replace candidates that turned out to be stale, and stop once
+        ``max_claim_misses`` of them have. Jobs whose replica the node or
+        its owner already holds are looked up once and never popped. With
+        ``bin_packing`` only jobs that fit in the node's free cores, RAM
+        and GPU memory are taken, and the claim re-checks that against the
+        node's current leases. Slow nodes are steered towards small jobs,
+        see placement_penalty. With ``fair_share`` the candidates are drawn
+        from the submitters' queues in deficit round-robin order.
+
+        ``cached`` holds the cache_digest of the inputs and images the node
+        reports having (see Server.locality). Jobs whose input is among
+        them are taken first, see _pop_local.
+
+        A job with ``quorum`` above 1 stays pending until that many
+        distinct nodes hold it, so its replicas run in parallel. Popped
+        jobs that still have open slots go back into the index once this
+        node is served, which keeps it from popping them twice.
+        """
+        if not self.use_index:
+            return self.db.claim_matching(node_id, limit)
+        profile = self.db.get_node_profile(node_id)
+        if profile is None:
+            return []
+        leased = self._claim_speculative(node_id, profile, limit)
+        capacity = None
+        if self.bin_packing:
+            capacity = free_capacity(profile, self.db.get_committed(node_id))
+        penalty = self.placement_penalty(node_id)
+        held = self.db.get_held(node_id)
+        passed = set()
+        misses = 0
+        job_ids = self._pop_local(profile, limit - len(leased), capacity,
+                                  penalty, cached, held)
+        while len(leased) < limit and misses < self.max_misses:
+            if not job_ids:
+                job_ids = self.index.pop_many(
+                    profile, limit - len(leased), capacity, penalty, held
+                )
+                if not job_ids:
+                    break
+                self.local_index.discard(job_ids)
+            claimed = self.db.claim_jobs(job_ids, node_id)
+            if self.fair_share:
+                self.index.settle(
+                    job_ids, {job["job_id"] for job in claimed}
+                )
+            leased.extend(claimed)
+            passed.update(job_ids)
+            misses += len(job_ids) - len(claimed)
+            if capacity is not None and len(claimed) < len(job_ids):
+                # Give back what was reserved for the jobs that missed.
+                capacity = free_capacity(
+                    profile, self.db.get_committed(node_id)
+                )
+            if self.replicas == 1:
+                # Claimed jobs are fully dispatched; only misses may remain.
+                passed.difference_update(job["job_id"] for job in claimed)
+            job_ids = []
+        if passed:
+            requeued = self._requeue(passed)
+            if any(job["job_id"] in requeued for job in leased):
+                # Their remaining replica slots are for other nodes. Misses
+                # alone wake nobody: they were claimable already, and a
+                # wake-up would only send parked nodes after them again.
+                self._available()
+        return leased
+
+    def _pop_local(self, profile, limit, capacity, penalty, cached,
+                   held=frozenset()):
+        """Take up to ``limit`` indexed jobs whose input the node caches.
+
+        Jobs whose image is cached as well go first, then by dispatch
+        rank. They may overtake more urgent jobs without a cached input,
+        but only by ``locality.max_advance`` seconds of rank, so those are
+        delayed, never starved. ``locality.scan`` bounds the jobs examined
+        per cached input. Capacity and the placement penalty apply as in
+        pop_many, and with ``fair_share`` a submitter past its share is
+        skipped (see FairShareIndex.take). Jobs in ``held`` are left alone.
+        """
+        if not (cached and limit and self.locality.get("enabled", True)):
+            return []
+        candidates = self.local_index.candidates(
+            cached, self.locality.get("scan", 64)
+        )
+        if not candidates:
+            return []
+        best = self.index.peek_rank(profile, penalty)
+        if best is None:
+            return []
+        latest = best + self.locality.get("max_advance", 600)
+        job_ids = []
+        for job_id, rank, requirements, flops in candidates:
+            if job_id in held:
+                continue
+            if penalty is not None:
+                rank += penalty(flops)
+            if rank > latest:
+                continue
+            if not meets_requirements(profile, requirements):
+                continue
+            demand = resource_demand(requirements)
+            if capacity is not None and not fits(demand, capacity):
+                continue
+            if not self.index.take(job_id):
+                continue
+            if capacity is not None:
+                consume(capacity, demand)
+            job_ids.append(job_id)
+            if len(job_ids) == limit:
+                break
+        self.local_index.discard(job_ids)
+        return job_ids
+
+    def _claim_speculative(self, node_id, profile, limit):
+        """Give a fast, idle node the speculative copies it can run.
+
+        A node is fast if its measured throughput reaches the fleet's
+        fast_flops (any node is, before the fleet has been measured) and
+        idle if it holds no leases. Copies it cannot take stay reserved.
+        """
+        with self._speculative_lock:
+            if not self._speculative:
+                return []
+        if self.db.get_committed(node_id):
+            return []
+        fast = self.fast_flops()
+        node_flops = self.db.get_node_flops(node_id)
+        if fast and not (node_flops and node_flops >= fast):
+            return []
+        with self._speculative_lock:
+            candidates = sorted(
+                (rank, job_id)
+                for job_id, (job, rank) in self._speculative.items()
+                if meets_requirements(profile, job.get("requirements") or {})
+            )
+            taken = {
+                job_id: self._speculative.pop(job_id)
+                for _, job_id in candidates[:limit]
+            }
+        if not taken:
+            return []
+        claimed = self.db.claim_jobs(list(taken), node_id)
+        missed = set(taken) - {job["job_id"] for job in claimed}
+        pending = self.db.get_pending(list(missed)) if missed else []
+        with self._speculative_lock:
+            for job_id, _, _ in pending:
+                self._speculative[job_id] = taken[job_id]
+        return claimed
+
+    def speculate(self, now=None):
+        """Launch a speculative copy of every job with a straggling replica.
+
+        A replica straggles once it has run longer than the
+        ``speculation.percentile`` of its job type's observed runtimes or,
+        until ``speculation.min_samples`` runs of the type have been seen,
+        longer than ``speculation.estimate_factor`` times its estimate_time
+        on the node. Each such job gets one more replica slot, held for a
+        fast idle node; the first replicas to reach quorum finalize the
+        job, and the losers find their lease gone at their next heartbeat.
+        Copies kept for jobs that are no longer pending are dropped first.
+        Returns the number of copies launched.
+        """
+        config = self.speculation
+        if not config.get("enabled", True):
+            return 0
+        self._prune_speculative()
+        now = self.clock() if now is None else now
+        max_copies = config.get("max_copies", 1)
+        running = self.db.get_running_replicas(
+            now - config.get("min_elapsed", 30), max_copies
+        )
+        fast = self.fast_flops()
+        expected, overdue = {}, []
+        for job_id, job_type, flops, leased_at, node_flops in running:
+            if job_type not in expected:
+                expected[job_type] = self.db.get_runtime_quantile(
+                    job_type, config.get("percentile", 0.9),
+                    config.get("min_samples", 20)
+                )
+            threshold = expected[job_type]
+            if threshold is None and flops and (node_flops or fast):
+                threshold = config.get("estimate_factor", 2.0) * estimate_time(
+                    {"estimated_flops": flops}, node_flops or fast
+                )
+            if (threshold is not None and now - leased_at > threshold
+                    and job_id not in overdue):
+                overdue.append(job_id)
+        copies = self.db.add_speculative_replicas(overdue, max_copies)
+        with self._speculative_lock:
+            for job_id, job, rank in copies:
+                self._speculative[job_id] = (job, rank)
+        if copies:
+            self._available()
+        return len(copies)
+
+    def _prune_speculative(self):
+        """Forget speculative copies whose job finished or was claimed."""
+        with self._speculative_lock:
+            job_ids = list(self._speculative)
+        if not job_ids:
+            return
+        pending = {job_id for job_id, _, _ in self.db.get_pending(job_ids)}
+        with self._speculative_lock:
+            for job_id in job_ids:
+                if job_id not in pending:
+                    self._speculative.pop(job_id, None)
+
+    def _requeue(self, job_ids):
+        """Re-index popped jobs that were not claimed but are still pending.
+
+        Returns the set of job_ids that went back; the rest were taken by
+        another claim.
+        """
+        pending = self.db.get_pending(list(job_ids))
+        for job_id, job, rank in pending:
+            self._index(job_id, job, rank)
+        return {job_id for job_id, _, _ in pending}
+
+    def record_votes(self, results, quorum):
+        """Record result votes; re-index jobs that need another replica.
+
+        See DB.record_votes. A job whose replicas all reported without
+        agreeing gets one more slot, and becomes claimable again.
+        """
+        outcomes = self.db.record_votes(results, quorum)
+        reopened = [outcome["job_id"] for outcome in outcomes
+                    if outcome.get("reopened")]
+        if reopened and self.use_index:
+            self._requeue(reopened)
+        if reopened:
+            self._available()
+        return outcomes
+
+    def renew_leases(self, node_id, job_ids=None):
+        """Extend the node's job leases; returns the job_ids it still holds."""
+        return self.db.renew_leases(node_id, job_ids)
+
+    def reclaim_expired_leases(self):
+        """Requeue every job whose lease has expired; returns how many."""
+        total = 0
+        while True:
+            reclaimed = self.db.reclaim_expired_leases()
+            if not reclaimed:
+                if total:
+                    self._available()
+                return total
+            if self.use_index:
+                for job_id, job, rank in reclaimed:
+                    self._index(job_id, job, rank)
+            total += len(reclaimed)
+
+    def sync_index(self, page_size=1000):
+        """Index jobs queued through other coordinator processes.
+
+        Tails the storage change feed for jobs that became pending (new
+        submissions and reclaimed leases) since the last call and indexes
+        those still pending. If the feed was trimmed past our position the
+        index is rebuilt instead. Returns the number of jobs newly indexed.
+        """
+        if not self.use_index:
+            return 0
+        added = 0
+        while True:
+            feed = self.db.get_changes(self._synced_seq, page_size)
+            if feed["reset"]:
+                self.rebuild_index()
+                added = len(self.index)
+                break
+            job_ids = list({
+                change["id"] for change in feed["changes"]
+                if change["kind"] == "job" and change["status"] == "pending"
+            })
+            for job_id, job, rank in self.db.get_pending(job_ids):
+                added += self._index(job_id, job, rank)
+            self._synced_seq = feed["last_seq"]
+            if len(feed["changes"]) < page_size:
+                break
+        if added:
+            self._available()
+        return added
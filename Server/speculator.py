@@ -0,0 +1,52 @@
+"""
+Background launch of speculative copies for straggling job replicas.
+"""
+import logging
+import threading
+from prometheus_client import Counter
+
+
+logger = logging.getLogger(__name__)
+
+speculative_copies_counter = Counter(
+    "nexapod_job_speculative_total",
+    "Total number of speculative replicas launched for straggling jobs"
+)
+
+
+class Speculator:
+    """Periodically re-executes straggling replicas on fast idle nodes."""
+
+    def __init__(self, scheduler, interval=10):
+        self.scheduler = scheduler
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="nexapod-speculator", daemon=True
+        )
+
+    def start(self):
+        """Start checking for stragglers in a daemon thread."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop the speculator and wait for the current pass to finish."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def check(self):
+        """Run one straggler pass and return the number of copies launched."""
+        launched = self.scheduler.speculate()
+        if launched:
+            speculative_copies_counter.inc(launched)
+            logger.info("Launched %d speculative replicas", launched)
+        return launched
+
+    def _run(self):
+        """Check every ``interval`` seconds until stopped."""
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Straggler check failed")
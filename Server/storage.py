@@ -0,0 +1,123 @@
+"""
+Storage interface used by the coordinator, and backend selection.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Protocol, Set, Tuple
+
+
+class Storage(Protocol):
+    """Persistence of nodes, jobs, leases, votes and results.
+
+    ``Server.db.DB`` is the SQLite implementation and
+    ``Server.memory_store.MemoryStorage`` keeps everything in process
+    memory. Methods are called from worker threads and must be safe to
+    call concurrently.
+    """
+
+    def register_node(self, profile: Dict[str, Any]) -> str:
+        ...
+
+    def get_node_profile(self, node_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    def list_nodes(self, after: Optional[str] = None, limit: int = 1000,
+                   fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        ...
+
+    def add_job(self, job: Dict[str, Any],
+                rank: Optional[float] = None) -> None:
+        ...
+
+    def add_jobs(self, jobs: List[Dict[str, Any]],
+                 ranks: Optional[List[float]] = None) -> int:
+        ...
+
+    def iter_pending_jobs(
+        self, page_size: int = 256
+    ) -> Iterator[Tuple[str, Dict[str, Any], float]]:
+        ...
+
+    def get_pending(
+        self, job_ids: List[str]
+    ) -> List[Tuple[str, Dict[str, Any], float]]:
+        ...
+
+    def get_committed(self, node_id: str) -> List[Dict[str, float]]:
+        ...
+
+    def get_held(self, node_id: str) -> Set[str]:
+        ...
+
+    def claim_jobs(self, job_ids: List[str],
+                   node_id: str) -> List[Dict[str, Any]]:
+        ...
+
+    def claim_matching(self, node_id: str,
+                       limit: int) -> List[Dict[str, Any]]:
+        ...
+
+    def renew_leases(self, node_id: str,
+                     job_ids: Optional[List[str]] = None) -> List[str]:
+        ...
+
+    def reclaim_expired_leases(
+        self, now: Optional[float] = None, limit: int = 1000
+    ) -> List[Tuple[str, Dict[str, Any], float]]:
+        ...
+
+    def get_node_flops(self, node_id: str) -> Optional[float]:
+        ...
+
+    def get_fleet_flops(self, quantile: float) -> Optional[float]:
+        ...
+
+    def get_runtime_quantile(self, job_type: Optional[str], quantile: float,
+                             min_samples: int = 1) -> Optional[float]:
+        ...
+
+    def get_running_replicas(
+        self, leased_before: float, max_speculated: int, limit: int = 1000
+    ) -> List[Tuple[str, Optional[str], float, float, Optional[float]]]:
+        ...
+
+    def add_speculative_replicas(
+        self, job_ids: List[str], max_speculated: int
+    ) -> List[Tuple[str, Dict[str, Any], float]]:
+        ...
+
+    def record_votes(self, results: List[Dict[str, Any]],
+                     quorum: int) -> List[Dict[str, Any]]:
+        ...
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    def list_jobs(self, after: Optional[str] = None, limit: int = 1000,
+                  status: Optional[str] = None,
+                  submitter: Optional[str] = None,
+                  fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        ...
+
+    def get_changes(self, since: int = 0,
+                    limit: int = 1000) -> Dict[str, Any]:
+        ...
+
+    def compact_finished(self, before: float, limit: int = 500) -> int:
+        ...
+
+    def trim_changes(self, keep: int) -> int:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+def create_storage(config: Dict[str, Any]) -> Storage:
+    """Build the backend named by ``storage_backend`` (sqlite or memory)."""
+    backend = config.get("storage_backend", "sqlite")
+    if backend == "sqlite":
+        from Server.db import DB
+        return DB(config)
+    if backend == "memory":
+        from Server.memory_store import MemoryStorage
+        return MemoryStorage(config)
+    raise ValueError(f"Unknown storage_backend: {backend}")
@@ -0,0 +1,52 @@
+"""
+Background reclaim of jobs whose node stopped renewing its lease.
+"""
+import logging
+import threading
+from prometheus_client import Counter
+
+
+logger = logging.getLogger(__name__)
+
+leases_reclaimed_counter = Counter(
+    "nexapod_job_lease_reclaimed_total",
+    "Total number of jobs returned to the queue after their lease expired"
+)
+
+
+class LeaseSweeper:
+    """Periodically returns jobs with expired leases to the pending queue."""
+
+    def __init__(self, scheduler, interval=15):
+        self.scheduler = scheduler
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="nexapod-lease-sweeper", daemon=True
+        )
+
+    def start(self):
+        """Start sweeping in a daemon thread."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop the sweeper and wait for the current pass to finish."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def sweep(self):
+        """Run one reclaim pass and return the number of jobs requeued."""
+        reclaimed = self.scheduler.reclaim_expired_leases()
+        if reclaimed:
+            leases_reclaimed_counter.inc(reclaimed)
+            logger.info("Reclaimed %d jobs with expired leases", reclaimed)
+        return reclaimed
+
+    def _run(self):
+        """Sweep every ``interval`` seconds until stopped."""
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Lease sweep failed")
@@ -0,0 +1,117 @@
+"""
+Group-commit writer for the NEXAPod coordinator database.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from prometheus_client import Histogram
+
+
+commit_batch_size = Histogram(
+    "nexapod_db_commit_batch_size",
+    "Number of write operations committed per transaction",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024),
+)
+commit_latency = Histogram(
+    "nexapod_db_commit_seconds",
+    "Time spent applying and committing one group of write operations",
+)
+
+
+class GroupCommitWriter:
+    """Applies queued write operations on one thread, committing in groups.
+
+    An operation is a callable taking a cursor. Each one runs inside its
+    own savepoint, so a failing operation is rolled back and reported to its
+    caller without affecting the rest of the group. Futures resolve only
+    after the group's COMMIT returns, so a resolved future means the write
+    is durable.
+    """
+
+    def __init__(self, db_path, timeout=30, max_batch=256, max_delay=0.002):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.conn = sqlite3.connect(
+            db_path, timeout=timeout, check_same_thread=False,
+            isolation_level=None
+        )
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="nexapod-db-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, op) -> Future:
+        """Queue a write operation and return a future for its result."""
+        future = Future()
+        self._queue.put((op, future))
+        return future
+
+    def execute(self, op):
+        """Queue a write operation and block until it is committed."""
+        return self.submit(op).result()
+
+    def close(self):
+        """Flush queued operations, stop the thread and close the connection."""
+        self._queue.put(None)
+        self._thread.join()
+        self.conn.close()
+
+    def _run(self):
+        """Collect operations into groups and commit them until closed."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    timeout = deadline - time.monotonic()
+                    if timeout > 0:
+                        item = self._queue.get(timeout=timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        """Apply a group of operations in one transaction and resolve them."""
+        start = time.perf_counter()
+        c = self.conn.cursor()
+        outcomes = []
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            for op, future in batch:
+                c.execute("SAVEPOINT op")
+                try:
+                    outcomes.append((future, op(c), None))
+                    c.execute("RELEASE op")
+                except Exception as e:
+                    c.execute("ROLLBACK TO op")
+                    c.execute("RELEASE op")
+                    outcomes.append((future, None, e))
+            c.execute("COMMIT")
+        except Exception as e:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        commit_batch_size.observe(len(batch))
+        commit_latency.observe(time.perf_counter() - start)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
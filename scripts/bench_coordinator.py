@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Measure coordinator request throughput for different worker counts.
+
+Starts the FastAPI coordinator (Server/app.py) once per requested worker
+count against a fresh SQLite database, queues a batch of jobs, then has a
+pool of simulated nodes lease jobs and post results until the queue is
+drained. Prints requests per second for each run and checks that every job
+was leased exactly once according to the aggregated Prometheus metrics.
+
+Usage: python scripts/bench_coordinator.py --workers 1 2 4 --jobs 5000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import yaml
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_config(workdir, workers, port):
+    """Write a benchmark config next to an accept-everything validator."""
+    plugin = os.path.join(workdir, "accept_all.py")
+    with open(plugin, "w") as f:
+        f.write("def check(result):\n    return True\n")
+    with open(os.path.join(PROJECT_ROOT, "Server", "config.yaml")) as f:
+        config = yaml.safe_load(f)
+    config.update({
+        "db_path": os.path.join(workdir, "bench.db"),
+        "port": port,
+        "quorum": 1,
+        "workers": workers,
+        "validator_plugin": plugin,
+        "prometheus_multiproc_dir": os.path.join(workdir, "metrics"),
+    })
+    path = os.path.join(workdir, "config.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump(config, f)
+    return path
+
+
+def start_server(config_path, port):
+    """Launch the coordinator and wait until /health answers."""
+    env = dict(os.environ, NEXAPOD_CONFIG=config_path)
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    env.pop("WORKERS", None)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "Server.app"], cwd=PROJECT_ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=1).ok:
+                return server, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Coordinator did not start")
+
+
+def register_node(url):
+    """Register a signed node profile and return its node_id."""
+    key = Ed25519PrivateKey.generate()
+    profile = {"cpu": "bench", "cores": 8, "threads": 16, "ram_gb": 32,
+               "os": "Linux", "gpu": []}
+    message = json.dumps(profile, sort_keys=True).encode()
+    public_key = key.public_key().public_bytes(
+        serialization.Encoding.Raw, serialization.PublicFormat.Raw
+    )
+    payload = dict(profile, signature=key.sign(message).hex(),
+                   public_key=public_key.hex())
+    response = requests.post(f"{url}/register", json=payload)
+    response.raise_for_status()
+    return response.json()["node_id"]
+
+
+def submit_jobs(url, count, run):
+    """Queue ``count`` trivial jobs in one batch."""
+    jobs = [
+        {
+            "schema_version": "1", "job_id": f"bench-{run}-{i:07d}",
+            "type": "bench", "input_files": [], "docker_image": "none",
+            "estimated_flops": 1.0e9, "tier": 1, "requirements": {},
+            "input_uri": "none", "tolerance": 0.0, "credit_rate": 1.0,
+        }
+        for i in range(count)
+    ]
+    response = requests.post(f"{url}/jobs/batch", json=jobs)
+    response.raise_for_status()
+
+
+def drain(url, node_ids, total, timeout):
+    """Lease and complete jobs from every node until ``total`` are done."""
+    done = [0]
+    requests_made = [0]
+    lock = threading.Lock()
+
+    def node_loop(node_id):
+        session = requests.Session()
+        while time.time() < timeout:
+            with lock:
+                if done[0] >= total:
+                    return
+            job = session.get(f"{url}/job",
+                              params={"node_id": node_id}).json()
+            count = 1
+            if job:
+                session.post(f"{url}/result", json={
+                    "job_id": job["job_id"], "node_id": node_id,
+                    "sha256": "bench",
+                })
+                count += 1
+            with lock:
+                requests_made[0] += count
+                done[0] += bool(job)
+            if not job:
+                time.sleep(0.05)
+
+    threads = [threading.Thread(target=node_loop, args=(node_id,))
+               for node_id in node_ids]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return done[0], requests_made[0], time.perf_counter() - start
+
+
+def assigned_total(url):
+    """Read nexapod_job_assigned_total from the (aggregated) metrics."""
+    for line in requests.get(f"{url}/metrics").text.splitlines():
+        if line.startswith("nexapod_job_assigned_total"):
+            return float(line.split()[-1])
+    return 0.0
+
+
+def run(workers, args):
+    """Benchmark one worker count and print its throughput."""
+    with tempfile.TemporaryDirectory() as workdir:
+        config_path = write_config(workdir, workers, args.port)
+        server, url = start_server(config_path, args.port)
+        try:
+            node_ids = [register_node(url) for _ in range(args.nodes)]
+            submit_jobs(url, args.jobs, workers)
+            # Give every worker's index a chance to pick the batch up.
+            time.sleep(args.settle)
+            done, made, elapsed = drain(
+                url, node_ids, args.jobs, time.time() + args.timeout
+            )
+            assigned = assigned_total(url)
+        finally:
+            server.terminate()
+            server.wait()
+    print(f"workers={workers:<3} jobs={done:<7} requests={made:<8} "
+          f"seconds={elapsed:8.2f} req/s={made / elapsed:9.1f} "
+          f"assigned_metric={assigned:.0f}")
+    if done != args.jobs or assigned != args.jobs:
+        print("  warning: not every job was leased exactly once")
+
+
+def main():
+    """Parse arguments and benchmark each worker count in turn."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--nodes", type=int, default=32,
+                        help="concurrent simulated nodes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="seconds to wait after queueing jobs")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+    # Workers beyond the core count only add contention.
+    print(f"host cores={os.cpu_count()}")
+    for workers in args.workers:
+        run(workers, args)
+
+
+if __name__ == "__main__":
+    main()
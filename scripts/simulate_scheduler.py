@@ -0,0 +1,717 @@
+#!/usr/bin/env python3
+"""
+Compare scheduling policies offline with a discrete-event simulation.
+
+Drives the real coordinator scheduler (Server.scheduler.Scheduler over
+Server.memory_store.MemoryStorage) and the node selection of the legacy
+Infrastructure.scheduler.Scheduler on a virtual clock, with a synthetic
+fleet of heterogeneous nodes that join and leave and a stream of jobs of
+varied size, priority, requirements and submitter, submitted in sweeps
+over shared inputs. Nothing is executed: a replica runs for its job's
+estimated FLOPs over the node's speed, with noise and occasional
+throttled stragglers, after downloading whatever of its input dataset
+and image the node does not cache. A day of cluster time takes seconds
+to minutes and needs no Docker, network or database file.
+
+Every policy sees the same fleet, churn timeline, job stream and runtimes.
+For each one the simulation reports throughput, queue wait and completion
+time percentiles, core utilization and fairness (Jain's index over the
+submitters' mean bounded slowdown), and the bytes downloaded per replica
+and cold-start time before it runs. Utilization is measured while jobs
+are still arriving, so the drain at the end does not dilute it. Runs are
+reproducible for a given --seed when PYTHONHASHSEED is fixed too, since
+the scheduler index shards jobs by hash.
+
+Usage: python scripts/simulate_scheduler.py --nodes 2000 --jobs 20000 \\
+           --policy server server-basic legacy --set quorum=2
+"""
+
+import argparse
+import bisect
+import copy
+import heapq
+import itertools
+import math
+import os
+import random
+import sys
+from collections import OrderedDict, defaultdict
+
+import yaml
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from Infrastructure.perf_estimator import estimate_flops  # noqa: E402
+from Infrastructure.scheduler import (  # noqa: E402
+    Scheduler as LegacyScheduler,
+)
+from Server.locality import cache_digest  # noqa: E402
+from Server.matcher import resource_demand  # noqa: E402
+from Server.memory_store import MemoryStorage  # noqa: E402
+from Server.scheduler import Scheduler  # noqa: E402
+
+# Config overrides applied on top of Server/config.yaml for each policy;
+# "legacy" is simulated separately.
+POLICIES = {
+    "server": {},
+    "server-basic": {
+        "bin_packing": False,
+        "placement_weight": 0,
+        "speculation": {"enabled": False},
+        "fair_share": {"enabled": False},
+        "locality": {"enabled": False},
+    },
+    "legacy": None,
+}
+JOB_TYPES = ("render", "train", "simulate", "fold", "compile")
+PRIORITIES = ("low", "normal", "high", "urgent")
+
+
+class VirtualClock:
+    """Simulated seconds, passed to the storage and scheduler as ``clock``."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_fleet(rng, count):
+    """Return ``count`` node profiles and their per-job FLOPs/s."""
+    fleet = []
+    for i in range(count):
+        gpus = []
+        if rng.random() < 0.2:
+            gpus = [
+                {"name": "sim-gpu", "memory_gb": rng.choice((8, 12, 16, 24))}
+                for _ in range(rng.choice((1, 1, 2)))
+            ]
+        # A tenth of the nodes belong to an operator running several.
+        owner = f"owner-{i}"
+        if fleet and rng.random() < 0.1:
+            owner = rng.choice(fleet)[0]["public_key"]
+        cores = rng.choice((2, 4, 8, 16, 32))
+        profile = {
+            "cpu": "sim", "cores": cores, "threads": cores * 2,
+            "ram_gb": rng.choice((4, 8, 16, 32, 64, 128)),
+            "os": rng.choices(("Linux", "Windows", "Darwin"), (8, 1, 1))[0],
+            "gpu": gpus, "public_key": owner,
+        }
+        flops = 10 ** rng.uniform(11, 12.5) * (3 if gpus else 1)
+        fleet.append((profile, flops))
+    return fleet
+
+
+def make_churn(rng, count, horizon, mean_up, mean_down):
+    """Return each node's sorted list of (joined, left) online intervals."""
+    timeline = []
+    availability = mean_up / (mean_up + mean_down)
+    for _ in range(count):
+        intervals = []
+        online = rng.random() < availability
+        t = 0.0
+        while t < horizon:
+            span = rng.expovariate(1 / (mean_up if online else mean_down))
+            if online:
+                intervals.append((t, t + span))
+            t += span
+            online = not online
+        timeline.append(intervals)
+    return timeline
+
+
+def make_artifacts(rng, prefix, count, median_gb):
+    """Return ``count`` (reference, size in bytes) inputs or images."""
+    return [(f"{prefix}{i}", median_gb * 1e9 * rng.lognormvariate(0, 0.5))
+            for i in range(count)]
+
+
+def make_jobs(rng, count, submitters, datasets, images, sweep):
+    """Return ``count`` job descriptors and the sizes of their sweeps.
+
+    Jobs come in sweeps of consecutive jobs, ``sweep`` long on average,
+    that one submitter runs over the same input, image and requirements,
+    as in repeated workloads. Inputs and images are drawn Zipf-distributed
+    from ``datasets`` and ``images``, so popular ones recur across sweeps.
+    """
+    input_weights = list(itertools.accumulate(
+        1 / (k + 1) for k in range(len(datasets))
+    ))
+    image_weights = list(itertools.accumulate(
+        1 / (k + 1) for k in range(len(images))
+    ))
+    jobs, sweeps = [], []
+    while len(jobs) < count:
+        size = min(1 + int(rng.expovariate(1 / sweep)), count - len(jobs))
+        requirements = {}
+        kind = rng.random()
+        if kind < 0.15:
+            requirements["ram_gb"] = rng.choice((8, 16, 32))
+        elif kind < 0.25:
+            requirements["cores"] = rng.choice((4, 8))
+        elif kind < 0.35:
+            requirements.update(gpu_count=1, gpu_mem_gb=rng.choice((8, 16)))
+        if rng.random() < 0.1:
+            requirements["os"] = "Linux"
+        # Submitter activity is heavy-tailed: a few submit most jobs.
+        submitter = min(int(rng.paretovariate(1.2)), submitters) - 1
+        (input_uri, _), = rng.choices(datasets, cum_weights=input_weights)
+        (image, _), = rng.choices(images, cum_weights=image_weights)
+        job_type = rng.choice(JOB_TYPES)
+        priority = rng.choices(PRIORITIES, (2, 6, 2, 0.5))[0]
+        for _ in range(size):
+            jobs.append({
+                "schema_version": "1", "job_id": f"sim-{len(jobs):07d}",
+                "type": job_type, "input_files": [],
+                "docker_image": image, "input_uri": input_uri,
+                "estimated_flops": 10 ** rng.uniform(12, 15), "tier": 1,
+                "requirements": dict(requirements), "tolerance": 0.0,
+                "credit_rate": 1.0, "submitter": f"user-{submitter}",
+                "priority": priority,
+            })
+        sweeps.append(size)
+    return jobs, sweeps
+
+
+def arrival_times(rng, jobs, sweeps, fleet, churn, horizon, load, quorum):
+    """Return arrival times that keep the fleet ``load`` busy.
+
+    Sweeps arrive as a Poisson process and all their jobs at once.
+    Capacity is the fleet's online core-FLOPs/s averaged over the horizon;
+    demand is each job's cores times its FLOPs, once per replica.
+    """
+    online = sum(
+        sum(min(end, horizon) - start for start, end in intervals)
+        for intervals in churn
+    ) / (len(churn) * horizon)
+    capacity = online * sum(
+        profile["cores"] * flops for profile, flops in fleet
+    )
+    work = sum(
+        estimate_flops(job) * resource_demand(job["requirements"])["cores"]
+        for job in jobs
+    ) / len(sweeps) * quorum
+    rate = load * capacity / work
+    t, times = 0.0, []
+    for size in sweeps:
+        t += rng.expovariate(rate)
+        times.extend([t] * size)
+    return times
+
+
+class Runtimes:
+    """Replica run times, identical for every policy.
+
+    A replica takes its job's FLOPs over the node's FLOPs/s with lognormal
+    noise; a ``straggler_rate`` share of them is throttled several times.
+    """
+
+    def __init__(self, fleet, seed, straggler_rate):
+        self.fleet = fleet
+        self.seed = seed
+        self.straggler_rate = straggler_rate
+
+    def __call__(self, job, node):
+        rng = random.Random(f"{self.seed}:{job['job_id']}:{node}")
+        seconds = estimate_flops(job) / self.fleet[node][1]
+        seconds *= rng.lognormvariate(0, 0.25)
+        if rng.random() < self.straggler_rate:
+            seconds *= rng.uniform(3, 10)
+        return seconds
+
+
+class NodeCaches:
+    """Per-node least-recently-used disk caches of inputs and images.
+
+    A replica first downloads what the node lacks of its input and image
+    at ``bandwidth`` bytes/s; concurrent downloads do not share it. Caches
+    survive the node going offline, as a disk would.
+    """
+
+    def __init__(self, count, capacity, bandwidth, artifacts):
+        self.capacity = capacity
+        self.bandwidth = bandwidth
+        self.sizes = {cache_digest(reference): size
+                      for reference, size in artifacts}
+        self.caches = [OrderedDict() for _ in range(count)]
+
+    def digests(self, node):
+        """Return what the node reports as cached when it polls."""
+        return frozenset(self.caches[node])
+
+    def start(self, node, job):
+        """Fetch a replica's missing artifacts; returns (bytes, seconds)."""
+        cache = self.caches[node]
+        fetched = 0.0
+        for reference in (job["input_uri"], job["docker_image"]):
+            digest = cache_digest(reference)
+            if digest in cache:
+                cache.move_to_end(digest)
+                continue
+            fetched += self.sizes[digest]
+            cache[digest] = self.sizes[digest]
+        used = sum(cache.values())
+        while used > self.capacity and len(cache) > 2:
+            used -= cache.popitem(last=False)[1]
+        return fetched, fetched / self.bandwidth
+
+
+def percentile(values, q):
+    """Return the nearest-rank ``q`` percentile of values, or nan."""
+    if not values:
+        return math.nan
+    values = sorted(values)
+    return values[min(int(math.ceil(q / 100 * len(values))) - 1,
+                      len(values) - 1)]
+
+
+def jain_index(values):
+    """Return Jain's fairness index: 1 when all values are equal."""
+    values = list(values)
+    if not values:
+        return math.nan
+    squares = sum(value * value for value in values)
+    return sum(values) ** 2 / (len(values) * squares) if squares else 1.0
+
+
+class Stats:
+    """Per-job timings and core accounting collected during a run."""
+
+    # Runs shorter than this count as this long in slowdowns.
+    SLOWDOWN_BOUND = 60.0
+
+    def __init__(self, jobs, arrivals, fleet):
+        self.jobs = {job["job_id"]: job for job in jobs}
+        self.submitted = {
+            job["job_id"]: t for job, t in zip(jobs, arrivals)
+        }
+        self.dispatched = {}
+        self.finished = {}
+        self.window = arrivals[-1]
+        self.busy_core_seconds = 0.0
+        self.online_core_seconds = 0.0
+        self.fetched_bytes = []
+        self.cold_starts = []
+        speeds = sorted(flops for _, flops in fleet)
+        self.reference_flops = speeds[len(speeds) // 2]
+
+    def _overlap(self, start, end):
+        """Return the seconds of [start, end) inside the arrival window."""
+        return max(min(end, self.window) - min(start, self.window), 0.0)
+
+    def busy(self, start, end, cores):
+        """Account cores used by a replica between start and end."""
+        self.busy_core_seconds += self._overlap(start, end) * cores
+
+    def online(self, start, end, cores):
+        """Account a node's cores being online between start and end."""
+        self.online_core_seconds += self._overlap(start, end) * cores
+
+    def fetch(self, fetched, seconds):
+        """Record a replica's download before it could start."""
+        self.fetched_bytes.append(fetched)
+        self.cold_starts.append(seconds)
+
+    def dispatch(self, job_id, now):
+        """Record a replica start; the first one ends the queue wait."""
+        self.dispatched.setdefault(job_id, now)
+
+    def finish(self, job_id, now):
+        """Record the job reaching quorum."""
+        self.finished[job_id] = now
+
+    def report(self, name, end):
+        """Return one formatted result line for the policy."""
+        waits = [self.dispatched[job_id] - self.submitted[job_id]
+                 for job_id in self.dispatched]
+        completions = [now - self.submitted[job_id]
+                       for job_id, now in self.finished.items()]
+        slowdowns = defaultdict(list)
+        for job_id, now in self.finished.items():
+            job = self.jobs[job_id]
+            ideal = estimate_flops(job) / self.reference_flops
+            slowdowns[job["submitter"]].append(
+                (now - self.submitted[job_id])
+                / max(ideal, self.SLOWDOWN_BOUND)
+            )
+        fairness = jain_index(
+            sum(values) / len(values) for values in slowdowns.values()
+        )
+        hours = end / 3600
+        utilization = (self.busy_core_seconds / self.online_core_seconds
+                       if self.online_core_seconds else 0.0)
+        fetched = (sum(self.fetched_bytes) / len(self.fetched_bytes) / 1e6
+                   if self.fetched_bytes else 0.0)
+        return (
+            f"{name:<13} done={len(self.finished):>6}/{len(self.jobs):<6} "
+            f"jobs/h={len(self.finished) / hours:9.1f} "
+            f"wait p50/p90/p99={percentile(waits, 50):8.0f}/"
+            f"{percentile(waits, 90):8.0f}/{percentile(waits, 99):8.0f}s "
+            f"done p50/p99={percentile(completions, 50):8.0f}/"
+            f"{percentile(completions, 99):8.0f}s "
+            f"util={utilization:6.1%} fairness={fairness:.3f} "
+            f"MB/replica={fetched:6.0f} "
+            f"cold p50/p90={percentile(self.cold_starts, 50):5.0f}/"
+            f"{percentile(self.cold_starts, 90):5.0f}s"
+        )
+
+
+class ServerSimulation:
+    """Runs the coordinator's Scheduler and MemoryStorage on a virtual clock.
+
+    Nodes behave like Client agents: they long-poll for up to max_lease
+    jobs whenever they have finished one, heartbeat their leases, and drop
+    jobs the coordinator reports as lost. A node going offline loses its
+    running replicas, which come back through lease expiry. Waking every
+    parked poll on each submission would dominate the run time, so each
+    notification wakes at most ``wake_batch`` parked nodes, oldest first;
+    the rest recheck every ``recheck`` seconds as with long_poll_recheck.
+    Run times do not slow down when a node is overcommitted, which flatters
+    policies that ignore capacity.
+    """
+
+    def __init__(self, config, fleet, churn, jobs, arrivals, runtimes,
+                 caches, args):
+        self.clock = VirtualClock()
+        self.config = config
+        self.db = MemoryStorage(config, self.clock)
+        self.scheduler = Scheduler(
+            self.db, config, self._notify, self.clock
+        )
+        self.fleet = fleet
+        self.churn = churn
+        self.jobs = jobs
+        self.arrivals = arrivals
+        self.runtimes = runtimes
+        self.caches = caches
+        self.args = args
+        self.quorum = config.get("quorum", 1)
+        self.stats = Stats(jobs, arrivals, fleet)
+        self.node_ids = [self.db.register_node(profile)
+                         for profile, _ in fleet]
+        self.online = [False] * len(fleet)
+        self.online_since = [0.0] * len(fleet)
+        # job_id -> (started, cores) of the replicas each node is running.
+        self.running = [{} for _ in fleet]
+        # Time of each node's next scheduled poll, or None.
+        self.next_poll = [None] * len(fleet)
+        self.parked = {}
+        self.notified = False
+        self.events = []
+        self.seq = 0
+
+    def _at(self, when, handler, *args):
+        """Schedule handler(*args) at virtual time ``when``."""
+        self.seq += 1
+        heapq.heappush(self.events, (when, self.seq, handler, args))
+
+    def _notify(self):
+        """on_available hook: wake parked polls once the event is done."""
+        self.notified = True
+
+    def run(self):
+        """Simulate until every job is finalized or the horizon passes."""
+        for job, when in zip(self.jobs, self.arrivals):
+            self._at(when, self._arrive, job)
+        for node, intervals in enumerate(self.churn):
+            for joined, left in intervals:
+                self._at(joined, self._join, node)
+                self._at(left, self._leave, node)
+        lease = self.config.get("lease_seconds", 300)
+        self._at(lease / 3, self._heartbeat, lease / 3)
+        self._at(self.config.get("lease_sweep_interval", 15), self._sweep)
+        speculation = self.config.get("speculation", {})
+        if speculation.get("enabled", True):
+            self._at(speculation.get("interval", 10), self._speculate)
+        while self.events and len(self.stats.finished) < len(self.jobs):
+            when, _, handler, args = heapq.heappop(self.events)
+            if when > self.args.hours * 3600:
+                break
+            self.clock.now = when
+            handler(*args)
+            if self.notified:
+                self.notified = False
+                self._wake(self.args.wake_batch)
+        end = self.clock.now
+        for node, since in enumerate(self.online_since):
+            if self.online[node]:
+                self._account_online(node, since, end)
+            for started, cores in self.running[node].values():
+                self.stats.busy(started, end, cores)
+        return self.stats.report(self.args.name, end)
+
+    def _account_online(self, node, start, end):
+        """Add a node's online time to the fleet's core-seconds."""
+        self.stats.online(start, end, self.fleet[node][0]["cores"])
+
+    def _wake(self, count):
+        """Poll up to ``count`` parked nodes now, longest parked first."""
+        for node in list(itertools.islice(self.parked, count)):
+            del self.parked[node]
+            self._poll_soon(node)
+
+    def _poll_soon(self, node, delay=0.0):
+        """Schedule a poll for the node unless an earlier one is pending."""
+        when = self.clock.now + delay
+        pending = self.next_poll[node]
+        if pending is None or pending > when:
+            self.next_poll[node] = when
+            self._at(when, self._poll, node, when)
+
+    def _arrive(self, job):
+        self.scheduler.submit_jobs([job])
+
+    def _join(self, node):
+        self.online[node] = True
+        self.online_since[node] = self.clock.now
+        self._poll_soon(node)
+
+    def _leave(self, node):
+        now = self.clock.now
+        self.online[node] = False
+        self.parked.pop(node, None)
+        self._account_online(node, self.online_since[node], now)
+        for started, cores in self.running[node].values():
+            self.stats.busy(started, now, cores)
+        self.running[node].clear()
+
+    def _poll(self, node, when):
+        if self.next_poll[node] != when:
+            # Superseded by an earlier poll.
+            return
+        self.next_poll[node] = None
+        if not self.online[node]:
+            return
+        now = self.clock.now
+        jobs = self.scheduler.assign_jobs(
+            self.node_ids[node], self.config.get("max_lease", 64),
+            self.caches.digests(node)
+        )
+        for job in jobs:
+            job_id = job["job_id"]
+            self.stats.dispatch(job_id, now)
+            cores = resource_demand(job.get("requirements"))["cores"]
+            self.running[node][job_id] = (now, cores)
+            fetched, cold = self.caches.start(node, job)
+            self.stats.fetch(fetched, cold)
+            self._at(now + cold + self.runtimes(job, node), self._finish,
+                     node, job_id, now)
+        if not jobs:
+            self.parked[node] = True
+            self._poll_soon(node, self.args.recheck)
+
+    def _finish(self, node, job_id, started):
+        replica = self.running[node].get(job_id)
+        if replica is None or replica[0] != started:
+            # Lost with the node going offline, or cancelled.
+            return
+        del self.running[node][job_id]
+        now = self.clock.now
+        self.stats.busy(started, now, replica[1])
+        (outcome,) = self.scheduler.record_votes([{
+            "job_id": job_id, "node_id": self.node_ids[node],
+            "sha256": "sim",
+        }], self.quorum)
+        if outcome["status"] == "finalized":
+            self.stats.finish(job_id, now)
+        self.parked.pop(node, None)
+        self._poll_soon(node)
+
+    def _heartbeat(self, interval):
+        """Renew every online node's leases and cancel the lost replicas."""
+        now = self.clock.now
+        for node, running in enumerate(self.running):
+            if not running:
+                continue
+            lost = set(running) - set(self.scheduler.renew_leases(
+                self.node_ids[node], list(running)
+            ))
+            for job_id in lost:
+                started, cores = running.pop(job_id)
+                self.stats.busy(started, now, cores)
+            if lost:
+                self._poll_soon(node)
+        self._at(now + interval, self._heartbeat, interval)
+
+    def _sweep(self):
+        self.scheduler.reclaim_expired_leases()
+        self._at(self.clock.now + self.config.get("lease_sweep_interval", 15),
+                 self._sweep)
+
+    def _speculate(self):
+        self.scheduler.speculate()
+        self._at(
+            self.clock.now
+            + self.config.get("speculation", {}).get("interval", 10),
+            self._speculate
+        )
+
+
+class LegacyFleet:
+    """Stands in for Infrastructure.database.Database in the legacy policy.
+
+    get_nodes returns the (id, _, profile repr) records that
+    Infrastructure.scheduler.Scheduler parses, for the nodes online at
+    the current virtual time.
+    """
+
+    def __init__(self, fleet, churn, clock):
+        self.records = [(str(node), None, repr(profile))
+                        for node, (profile, _) in enumerate(fleet)]
+        self.starts = [[start for start, _ in intervals] for intervals in churn]
+        self.churn = churn
+        self.clock = clock
+
+    def online(self, node):
+        """Return whether the node is online at the current time."""
+        i = bisect.bisect_right(self.starts[node], self.clock.now) - 1
+        return i >= 0 and self.clock.now < self.churn[node][i][1]
+
+    def get_nodes(self):
+        return [record for node, record in enumerate(self.records)
+                if self.online(node)]
+
+
+def simulate_legacy(fleet, churn, jobs, arrivals, runtimes, caches, args):
+    """Replay the legacy dispatcher loop (match_and_schedule).
+
+    It takes jobs strictly in arrival order, asks the real
+    _find_two_nodes_for_job for two online nodes, runs the job on both one
+    after the other, and drops the job if fewer than two nodes are free.
+    Requirements, priorities and node speed are not considered.
+    """
+    clock = VirtualClock()
+    stats = Stats(jobs, arrivals, fleet)
+    legacy = LegacyScheduler.__new__(LegacyScheduler)
+    # Skip __init__, which opens nexapod.db; the fleet replaces it.
+    legacy.db = LegacyFleet(fleet, churn, clock)
+    legacy.node_busy = {}
+    horizon = args.hours * 3600
+    free_at = 0.0
+    for job, arrived in zip(jobs, arrivals):
+        clock.now = max(arrived, free_at)
+        if clock.now > horizon:
+            break
+        node1, node2 = legacy._find_two_nodes_for_job()
+        if not node1 or not node2:
+            continue
+        stats.dispatch(job["job_id"], clock.now)
+        cores = resource_demand(job["requirements"])["cores"]
+        for node in (int(node1), int(node2)):
+            fetched, cold = caches.start(node, job)
+            stats.fetch(fetched, cold)
+            seconds = cold + runtimes(job, node)
+            stats.busy(clock.now, clock.now + seconds, cores)
+            clock.now += seconds
+        if clock.now <= horizon:
+            stats.finish(job["job_id"], clock.now)
+        free_at = clock.now
+    end = min(max(clock.now, free_at), horizon)
+    for node, intervals in enumerate(churn):
+        for joined, left in intervals:
+            stats.online(joined, left, fleet[node][0]["cores"])
+    return stats.report(args.name, end)
+
+
+def parse_override(text):
+    """Split ``a.b=value`` into its key path and YAML-parsed value."""
+    key, _, value = text.partition("=")
+    return key.split("."), yaml.safe_load(value)
+
+
+def apply_overrides(config, overrides):
+    """Return a copy of config with the nested overrides applied."""
+    config = copy.deepcopy(config)
+    for path, value in overrides:
+        target = config
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = value
+    return config
+
+
+def merge(config, policy):
+    """Return config with a policy's (nested) settings merged in."""
+    config = copy.deepcopy(config)
+    for key, value in policy.items():
+        if isinstance(value, dict):
+            config[key] = merge(config.get(key, {}), value)
+        else:
+            config[key] = value
+    return config
+
+
+def main():
+    """Build one workload and simulate it under every requested policy."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--policy", nargs="+", default=["server", "legacy"],
+                        choices=sorted(POLICIES))
+    parser.add_argument("--nodes", type=int, default=2000)
+    parser.add_argument("--jobs", type=int, default=20000)
+    parser.add_argument("--submitters", type=int, default=50)
+    parser.add_argument("--load", type=float, default=0.7,
+                        help="offered load as a share of fleet capacity")
+    parser.add_argument("--hours", type=float, default=48.0,
+                        help="virtual time limit")
+    parser.add_argument("--mean-uptime", type=float, default=4 * 3600)
+    parser.add_argument("--mean-downtime", type=float, default=1800)
+    parser.add_argument("--straggler-rate", type=float, default=0.02)
+    parser.add_argument("--sweep", type=float, default=10.0,
+                        help="mean jobs submitted together on one input")
+    parser.add_argument("--datasets", type=int, default=500,
+                        help="distinct job inputs")
+    parser.add_argument("--images", type=int, default=20,
+                        help="distinct Docker images")
+    parser.add_argument("--cache-gb", type=float, default=50.0,
+                        help="disk cache per node")
+    parser.add_argument("--bandwidth", type=float, default=50.0,
+                        help="download speed per node in MB/s")
+    parser.add_argument("--recheck", type=float, default=120.0,
+                        help="seconds between polls of a parked node")
+    parser.add_argument("--wake-batch", type=int, default=32,
+                        help="parked nodes woken per queued job")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--set", action="append", default=[],
+                        metavar="KEY=VALUE",
+                        help="override a config.yaml setting, e.g. quorum=2")
+    args = parser.parse_args()
+
+    with open(os.path.join(PROJECT_ROOT, "Server", "config.yaml")) as f:
+        base = apply_overrides(
+            yaml.safe_load(f), [parse_override(item) for item in args.set]
+        )
+    rng = random.Random(args.seed)
+    # The sharded index visits shards in random order.
+    random.seed(args.seed)
+    horizon = args.hours * 3600
+    fleet = make_fleet(rng, args.nodes)
+    churn = make_churn(rng, args.nodes, horizon, args.mean_uptime,
+                       args.mean_downtime)
+    datasets = make_artifacts(rng, "s3://sim-inputs/", args.datasets, 2.0)
+    images = make_artifacts(rng, "sim/image:", args.images, 1.5)
+    jobs, sweeps = make_jobs(rng, args.jobs, args.submitters, datasets,
+                             images, args.sweep)
+    arrivals = arrival_times(rng, jobs, sweeps, fleet, churn, horizon,
+                             args.load, base.get("quorum", 1))
+    runtimes = Runtimes(fleet, args.seed, args.straggler_rate)
+    print(f"{args.nodes} nodes, {args.jobs} jobs over "
+          f"{arrivals[-1] / 3600:.1f} h, quorum {base.get('quorum', 1)}")
+    for name in args.policy:
+        args.name = name
+        caches = NodeCaches(args.nodes, args.cache_gb * 1e9,
+                            args.bandwidth * 1e6, datasets + images)
+        if POLICIES[name] is None:
+            line = simulate_legacy(fleet, churn, jobs, arrivals, runtimes,
+                                   caches, args)
+        else:
+            line = ServerSimulation(
+                merge(base, POLICIES[name]), fleet, churn, jobs, arrivals,
+                runtimes, caches, args
+            ).run()
+        print(line)
+
+
+if __name__ == "__main__":
+    main()